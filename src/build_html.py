@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+#
+#    build_html.py
+#
+# create static bootstrap site from the csv of tajweed rule group counts,
+# one page per rule group plus a complete table
+#
+# Copyright (C) 2023 Alicia González Martínez
+#
+# dependencies:
+#   * pandas
+#   * ../data/tajweed_groups_30.csv (created with tajweed2df.py)
+#
+# examples:
+#   $ python build_html.py ../data/tajweed_groups_30.csv --out ../site
+#
+###############################################################################################################################
+
+import os
+import sys
+import pandas as pd
+from shutil import rmtree
+from string import Template
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+MYPATH = os.path.abspath(os.path.dirname(__file__))
+
+BOOTSTRAP_CSS = 'https://cdn.jsdelivr.net/npm/bootstrap@4.6.2/dist/css/bootstrap.min.css'
+
+CSS = """
+      body { padding: 1em; }
+      td, th { text-align: right; }
+      td:first-child, th:first-child { text-align: left; }
+"""
+
+HEADER = """<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>tajweed - $title</title>
+  <link rel="stylesheet" href="%s">
+  <style>$css</style>
+</head>""" % BOOTSTRAP_CSS
+
+TAB = '<li class="nav-item"><a class="nav-link $active" href="$link">$tab</a></li>'
+
+HTML = """<!DOCTYPE html>
+<html lang="en">
+$header
+<body>
+  <h1>$title</h1>
+  <p>$desc</p>
+  <ul class="nav nav-tabs">
+$menu
+  </ul>
+$table
+</body>
+</html>"""
+
+# templates are compiled once at import; css never changes, so it is substituted
+# in the header here and only the title is left for the per-page rendering.
+# the page template is split around the table slot so the table can be streamed
+# straight into the output file instead of being interpolated as one giant string
+_HEADER_TMPL = Template(Template(HEADER).safe_substitute(css=CSS))
+_HTML_PRE_TMPL, _HTML_POST_TMPL = (Template(part) for part in HTML.split('$table\n'))
+_TAB_TMPL = Template(TAB)
+
+# size of the output write buffer; bigger buffers are counterproductive
+OUT_BUFSIZE = 1 << 16
+
+# description of each group of rules; column suffixes _I and _B indicate if the
+# rule applies inside a word or at word boundary (cf. RULE_GROUPS in tajweed2df.py)
+RULES_DESC = {
+    'ALL':     'counts of all tajweed rule groups',
+    'ASSIM-M': 'assimilation rules of the mim',
+    'ASSIM-N': 'assimilation rules of the nun and the tanwin',
+    'ASSIM':   'other assimilation rules (mithlayn, mutajanisayn)',
+    'MADDA':   'madda prolongation rules',
+    'SHAMS':   'assimilation of lam to sun letters',
+    'CLIT-H':  'prolongation of the ha clitic',
+    'MIN-W':   'miniature waw',
+    'MIN-Y':   'miniature ya',
+    'P_SIL':   'alif silent in connected speech, pronounced in pause',
+    'SIL':     'silent letters',
+    'SAKT':    'smooth pause',
+}
+
+
+def write_table(out, df, bold_pos=-1):
+    """ write the complete html table for df into out, with the cell work done
+    by the C writer of pandas instead of a python loop over every row.
+
+    Args:
+        out (TextIOBase): output stream.
+        df (DataFrame): table of rule group counts.
+        bold_pos (int): position of column to render in bold, -1 for none.
+
+    """
+    if bold_pos >= 0:
+        col = df.columns[bold_pos]
+        df = df.assign(**{col: '<b>' + df[col].astype(str) + '</b>'})
+        df = df.rename(columns={col: f'<b>{col}</b>'})
+    df.to_html(buf=out, index=False, escape=False, border=0,
+               classes='table table-bordered table-striped table-sm')
+
+def create_menu(files, tabs, ibold=-1):
+    """ create html tab menu with one entry per page, marking entry ibold as active.
+
+    The inactive entries in tabs are rendered a single time by the caller; each
+    page only swaps in the rendered active entry, so building all the menus is
+    linear in the number of pages instead of quadratic.
+
+    Args:
+        files (list): sequence of page name, file name pairs.
+        tabs (list): entries of files already rendered as inactive.
+        ibold (int): index of active page in files, -1 for none.
+
+    Return:
+        str: html menu entries.
+
+    """
+    if ibold < 0:
+        return '\n'.join(tabs)
+    name, fname = files[ibold]
+    active = _TAB_TMPL.substitute(active='active bg-secondary text-white', link=fname, tab=name)
+    return '\n'.join(tabs[:ibold] + [active] + tabs[ibold+1:])
+
+def create_page(outpath, title, menu, df, bold_pos=-1):
+    """ render a complete html page with the table df and save it in outpath.
+
+    The page is streamed in parts so memory usage stays bounded by the write
+    buffer instead of the size of the largest page.
+
+    Args:
+        outpath (str): path of output html file.
+        title (str): title of the page.
+        menu (str): rendered html menu.
+        df (DataFrame): table of rule group counts to show.
+        bold_pos (int): position of column to render in bold, -1 for none.
+
+    """
+    with open(outpath, 'w', buffering=OUT_BUFSIZE) as out:
+        out.write(_HTML_PRE_TMPL.substitute(header=_HEADER_TMPL.substitute(title=title),
+                                            title=title,
+                                            desc=RULES_DESC.get(title.rsplit('_', 1)[0], ''),
+                                            menu=menu))
+        write_table(out, df, bold_pos)
+        out.write(_HTML_POST_TMPL.substitute())
+
+def _init_pages(df, nz_mask, files, tabs, outdir):
+    """ store the shared page data in worker globals so each page task only
+    has to pickle its index and not the whole frame.
+
+    """
+    global _DF, _NZ_MASK, _FILES, _TABS, _OUTDIR
+    _DF, _NZ_MASK, _FILES, _TABS, _OUTDIR = df, nz_mask, files, tabs, outdir
+
+def build_page(i):
+    """ render and save page i; pages are fully independent of each other.
+
+    Args:
+        i (int): index of page in the shared files list.
+
+    Return:
+        str: path of the saved html file.
+
+    """
+    name, fname = _FILES[i]
+    outpath = os.path.join(_OUTDIR, fname)
+    menu = create_menu(_FILES, _TABS, i)
+    if name == 'ALL':
+        create_page(outpath, name, menu, _DF)
+    else:
+        create_page(outpath, name, menu, _DF.iloc[_NZ_MASK[:, i-1]], bold_pos=_DF.columns.get_loc(name))
+    return outpath
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='create static html site with the counts of tajweed rule groups')
+    parser.add_argument('input', nargs='?', default=os.path.join(MYPATH, '../data/tajweed_groups_30.csv'),
+                                 help='csv file with rule group counts')
+    parser.add_argument('--out', default=os.path.join(MYPATH, '../site'), help='output directory')
+    args = parser.parse_args()
+
+    # declare the count columns as int32 so the parser skips type inference,
+    # and prefer the columnar pyarrow reader when it is available
+    with open(args.input) as fp:
+        header = fp.readline().rstrip('\n').split(',')
+    dtypes = {col: 'int32' for col in header if col != 'qindex'}
+
+    try:
+        df = pd.read_csv(args.input, dtype=dtypes, engine='pyarrow')
+    except ImportError:
+        df = pd.read_csv(args.input, dtype=dtypes, engine='c')
+
+    #
+    # prepare site directory
+    #
+
+    rmtree(args.out, ignore_errors=True)
+    os.makedirs(args.out)
+
+    #
+    # create one page per rule group column plus the complete table
+    #
+
+    files = [('ALL', 'index.html')] + [(col, f'{col}.html') for col in df.columns if col != 'qindex']
+
+    rendered_tabs = [_TAB_TMPL.substitute(active='', link=fname, tab=name) for name, fname in files]
+
+    # one vectorized comparison over the whole count block instead of one full
+    # scan and copy of the frame per column
+    nz_mask = df.drop(columns='qindex').to_numpy() != 0
+
+    # the pages are fully independent, so they are rendered in parallel; the
+    # shared data is handed to the workers once through the initializer
+    with ProcessPoolExecutor(initializer=_init_pages,
+                             initargs=(df, nz_mask, files, rendered_tabs, args.out)) as ex:
+        for outpath in ex.map(build_page, range(len(files))):
+            print(f'>> {outpath} saved', file=sys.stderr)
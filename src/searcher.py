@@ -67,7 +67,15 @@
 import os
 import re
 import sys
+import mmap
+import numpy as np
 import ujson as json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from bisect import bisect_right
+from itertools import accumulate
 from argparse import ArgumentParser, FileType, ArgumentTypeError
 
 
@@ -76,8 +84,22 @@ MUSHAF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../data/
 # spirits for the spirits
 CHAR_SPLITTER = re.compile(r'((?:[\[\(].+[\)\]]|\\?.)(?:\?|\+|\*|\{\d+(?:,\d+)?\})?\??)')
 
-NOISY_CHARS = {c : None for c in (0x200c, ord('<'), ord('>'), ord('['), ord(']'), 0x6d6,
-                                  0x6d7, 0x6d8, 0x6d9, 0x6da, 0x6db, 0x6de, 0x6e9)}
+# separator used to join all tokens in a single corpus string; it does not appear in the quranic text
+SEP = '\x1f'
+
+# integer index fields of each token record, kept as one contiguous array per
+# field instead of one dict per token
+INT_FIELDS = ('sura', 'vers', 'word', 'mpage', 'mword', 'cpage', 'cline', 'cword')
+
+# number of result lines accumulated before flushing them to the output stream
+OUT_BATCH = 4096
+
+NOISY_CHARS = ''.join(chr(c) for c in (0x200c, ord('<'), ord('>'), ord('['), ord(']'), 0x6d6,
+                                       0x6d7, 0x6d8, 0x6d9, 0x6da, 0x6db, 0x6de, 0x6e9))
+
+# real deletion table built once at import; translate skips the dict-lookup
+# fallback path in the C implementation with it
+_NORM_TABLE = str.maketrans('', '', NOISY_CHARS)
 
 
 def parse_seq(arg):
@@ -100,60 +122,219 @@ def parse_seq(arg):
     raise ArgumentTypeError('argument format must be (d)ddd,[(d)ddd,...], eg. 6e8,62c,650 ')
 
 
-def search_btw_words(str1, str2, tokens):
-    """ apply regex search of two strings str1 and str2 in two consecutive words from tokens
+def load_mushaf(fp, string, normalise):
+    """ load the token records from fp, memory-mapping the file so the bytes are
+    parsed in place without an intermediate copy.
+
+    For a literal query on the raw text, the mapped bytes are scanned first; if
+    the query does not appear anywhere in the file it cannot match any token, so
+    rare queries return before paying for the full parse. A file written with
+    ensure_ascii (the ujson/json fallback of the other scripts) stores the text
+    as \\uXXXX escapes instead of utf-8 bytes, so a negative on the raw bytes
+    only counts when the escaped form of the query is absent too. The prefilter
+    is only sound when the tokens are not normalised afterwards, since
+    normalisation deletes characters and can create matches that are absent
+    from the raw bytes.
+
+    Args:
+        fp (TextIOBase): input file containing the quran tokens.
+        string (str): query string.
+        normalise (bool): whether the tokens will be normalised after loading.
+
+    Return:
+        list: token records.
+
+    """
+    try:
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # pipes and other unmappable streams fall back to a plain read
+        data = fp.read()
+        return orjson.loads(data) if orjson else json.loads(data)
+
+    with mm:
+        if (not normalise and '_' not in string and re.escape(string) == string
+                and mm.find(string.encode()) == -1):
+            # the serializer that wrote the file may have escaped the arabic
+            # text, so probe the query the way ensure_ascii would store it
+            escaped = json.dumps(string)[1:-1].encode()
+            if escaped == string.encode() or mm.find(escaped) == -1:
+                return []
+        return orjson.loads(memoryview(mm)) if orjson else json.loads(mm[:].decode())
+
+def search_across_corpus(str1, str2, toks):
+    """ apply regex search of two strings str1 and str2 in two consecutive words
+    scanning all tokens joined in a single corpus string.
+
+    The tokens are joined once with SEP and the boundary pattern is searched in
+    one linear pass; the matched position is mapped back to the token position
+    with a bisect on the cumulative token lengths, instead of running two
+    anchored regex calls on every consecutive pair of tokens. When a wildcard
+    of the query swallows a separator, the boundaries inside the spoiled match
+    are probed with the anchored pair patterns, since a shorter valid match
+    can exist at the same start and the corpus scan will not retry it.
 
     Args:
         str1 (str): string to search in first word.
         str2 (str): string to search in following word.
+        toks (list): sequence of token strings.
 
     Yield:
-        int, dict, sre.SRE_Match object, int, dict, sre.SRE_Match object:
-            two pairs containing absolute index, token and search object.
+        int, list, int, list: two pairs containing token position and matched sequences.
 
     """
-    yield from filter(lambda x : x[2] and x[5],
-                        (
-                           (
-                             tokens[j][0],
-                             tokens[j][1],
-                             re.findall('(%s)$' % str1, tokens[j][1]['tok']),
-
-                             tokens[j+1][0],
-                             tokens[j+1][1],
-                             re.findall('^(%s)' % str2, tokens[j+1][1]['tok'])
-                           )
-                           for j in range(len(tokens)) if j<len(tokens)-1
-                        )
-                     )
-
-def apply_search(string, tokens):
-    """ search string in each token from tokens and in between two tokens.
+    corpus = SEP.join(toks)
+    offsets = [0] + list(accumulate(len(t)+1 for t in toks))
+
+    # the query parts go into named groups: a capturing group inside the query
+    # itself would shift the numbering of positional groups
+    pat = re.compile('(?P<w1>%s)%s(?P<w2>%s)' % (str1, SEP, str2))
+    pat_end = re.compile('(?P<w1>%s)$' % str1)
+    pat_start = re.compile('^(?P<w2>%s)' % str2)
+
+    # each word boundary is reported at most once, as in the anchored pair search
+    seen = set()
+
+    def pair_check(j):
+        # anchored probe of a single boundary, as in search_btw_words
+        seen.add(j)
+        if ((m1 := pat_end.search(toks[j])) is not None
+                and (m2 := pat_start.search(toks[j+1])) is not None):
+            return j, [m1.group('w1')], j+1, [m2.group('w2')]
+        return None
+
+    pos = 0
+    while (m := pat.search(corpus, pos)) is not None:
+        pos = m.start() + 1
+        if SEP in m.group('w1') or SEP in m.group('w2'):
+            # a wildcard swallowed a separator: re-check every boundary that
+            # falls inside the spoiled match with the anchored patterns. A
+            # match starting at or before the last probed separator has its
+            # own boundary among the probed ones, so the scan resumes past
+            # it — retrying at every offset is quadratic when the wildcard
+            # spans the corpus
+            sep_pos = corpus.find(SEP, m.start())
+            while sep_pos != -1 and sep_pos < m.end():
+                j = bisect_right(offsets, sep_pos) - 1
+                if j not in seen and (hit := pair_check(j)) is not None:
+                    yield hit
+                pos = sep_pos + 1
+                sep_pos = corpus.find(SEP, sep_pos + 1)
+            continue
+        j = bisect_right(offsets, m.start()) - 1
+        if j in seen:
+            continue
+        seen.add(j)
+        yield j, [m.group('w1')], j+1, [m.group('w2')]
+
+def search_literal(string, toks):
+    """ search a literal string in each token from toks with a single scan of
+    the joined corpus instead of one regex call per token.
+
+    str.find runs as a plain C scan, so queries without any regex metacharacter
+    (the common --hex case) never touch the regex engine; matched positions are
+    mapped back to tokens with a bisect on the cumulative token lengths.
+
+    Args:
+        string (str): literal sequence to search.
+        toks (list): sequence of token strings.
+
+    Yield:
+        int, list: token position and matched sequences.
+
+    """
+    corpus = SEP.join(toks)
+    offsets = [0] + list(accumulate(len(t)+1 for t in toks))
+
+    cur_j, cur_found = -1, None
+    start = corpus.find(string)
+    while start != -1:
+        j = bisect_right(offsets, start) - 1
+        if j != cur_j:
+            if cur_j != -1:
+                yield cur_j, cur_found
+            cur_j, cur_found = j, []
+        cur_found.append(string)
+        start = corpus.find(string, start + len(string))
+    if cur_j != -1:
+        yield cur_j, cur_found
+
+def search_btw_words(pat_end, pat_start, toks):
+    """ apply regex search of two anchored patterns in two consecutive words from toks
+
+    Args:
+        pat_end (Pattern): compiled pattern anchored to the end of the first word.
+        pat_start (Pattern): compiled pattern anchored to the start of the following word.
+        toks (list): sequence of token strings.
+
+    Yield:
+        int, list, int, list: two pairs containing token position and matched sequences.
+
+    """
+    # the second pattern is only tried when the first one hits, which on
+    # selective queries skips almost all of the second regex calls
+    for j in range(len(toks)-1):
+        m1 = pat_end.findall(toks[j])
+        if not m1:
+            continue
+        m2 = pat_start.findall(toks[j+1])
+        if not m2:
+            continue
+        yield j, m1, j+1, m2
+
+def apply_search(string, toks, only=False):
+    """ search string in each token from toks and in between two tokens.
 
     Args:
         string (str): sequence to search.
-        tokens (list): struct containig absolute index of token, and each token and its indexes as a dict.
+        toks (list): sequence of token strings.
+        only (bool): collect every matched sequence of a token, not just the first;
+            when the caller only prints the full token, the scan of each token
+            stops at its first match.
 
     yield:
-        int, dict, sre.SRE_Match object, int, dict, sre.SRE_Match object:
-            two pairs containing absolute index, token and search object.
-        int, dict, sre.SRE_Match object, dict: absolute index, token and search object.
+        int, list, int, list: two pairs containing token position and matched sequences.
+        int, list: token position and matched sequences.
 
     """
-    if '_' in args.string:
+    if '_' in string:
 
-        yield from search_btw_words(*args.string.split('_', 1), tokens)
+        yield from search_across_corpus(*string.split('_', 1), toks)
 
     else:
 
-        yield from filter(lambda x: x[2], ((i, tok, re.findall('(%s)' % args.string, tok['tok'])) for i, tok in tokens))
+        if re.escape(string) == string:
+
+            yield from search_literal(string, toks)
+
+        elif only:
+
+            pat = re.compile('(%s)' % string)
+
+            for j, tok in enumerate(toks):
+                matches = [m.group(1) for m in pat.finditer(tok)]
+                if matches:
+                    yield j, matches
+
+        else:
 
-        if not '^' in args.string and not '$' in args.string:
+            pat = re.compile('(%s)' % string)
 
-            segmented = re.findall(CHAR_SPLITTER, args.string)
+            for j, tok in enumerate(toks):
+                if (m := pat.search(tok)) is not None:
+                    yield j, [m.group(1)]
 
-            for i in range(1, len(segmented)):
-                yield from search_btw_words(''.join(segmented[:i]), ''.join(segmented[i:]), tokens)
+        if not '^' in string and not '$' in string:
+
+            # every (prefix, suffix) split of the query is fixed once the query is
+            # parsed, so the anchored patterns are compiled a single time up front
+            segmented = CHAR_SPLITTER.findall(string)
+            pairs = [(re.compile('(%s)$' % ''.join(segmented[:i])),
+                      re.compile('^(%s)' % ''.join(segmented[i:])))
+                     for i in range(1, len(segmented))]
+
+            for pat_end, pat_start in pairs:
+                yield from search_btw_words(pat_end, pat_start, toks)
 
 
 if __name__ == '__main__':
@@ -177,57 +358,71 @@ if __name__ == '__main__':
     if args.string.count('_') > 1:
         parser.error('--text cannot contain more than one word boundary mark "_"')
 
-    tokens = list(enumerate(json.load(args.file)))
+    tokens = list(enumerate(load_mushaf(args.file, args.string, not args.not_normalise)))
 
     if not args.not_normalise:
-        i = 0
-        while i < len(tokens):
-            tokens[i][1]['tok'] = tokens[i][1]['tok'].translate(NOISY_CHARS)
-            if not tokens[i][1]['tok']:
-                tokens.pop(i)
-            else:
-                i += 1
+        # single pass with the precomputed table; popping empties from the list
+        # in place made the normalisation quadratic in the number of tokens
+        tokens = [(i, {**tok, 'tok': norm}) for i, tok in tokens
+                  if (norm := tok['tok'].translate(_NORM_TABLE))]
+
+    #
+    # structure-of-arrays layout: one contiguous int array per index field and a
+    # flat list of token strings, instead of one dict per token
+    #
+
+    iabs = np.asarray([i for i, _ in tokens], dtype=np.int32)
+    fields = {k: np.asarray([tok[k] for _, tok in tokens], dtype=np.int32) for k in INT_FIELDS}
+    toks = [tok['tok'] for _, tok in tokens]
+    del tokens
 
-    results = apply_search(args.string, tokens)
+    sura, vers, word = fields['sura'], fields['vers'], fields['word']
+    mpage, mword = fields['mpage'], fields['mword']
+    cpage, cline, cword = fields['cpage'], fields['cline'], fields['cword']
 
-    for iabs, tok, found, *next_ in results:
+    results = apply_search(args.string, toks, only=args.only)
 
-        matches = found if args.only else [tok['tok']]
+    # results are flushed in batches so hit-heavy queries are not dominated by
+    # one write call per line
+    buf = []
+
+    # each index string is built a single time per token position; the second
+    # token of one cross-word hit is the first token of the next, and segmented
+    # queries report the same position once per split
+    idx_cache = {}
+
+    def fmt_idx(j):
+        if (idx := idx_cache.get(j)) is None:
+            idx_cache[j] = idx = (f'{sura[j]}:{vers[j]}:{word[j]},{mpage[j]}:{mword[j]},'
+                                  f'{cpage[j]}:{cline[j]}:{cword[j]},{iabs[j]}')
+        return idx
+
+    for j, found, *next_ in results:
+
+        idx = fmt_idx(j)
+
+        if next_:
+            j2, found2 = next_
+            idx2 = fmt_idx(j2)
+            match2 = found2[0] if args.only else toks[j2]
+
+        matches = found if args.only else [toks[j]]
 
         for match in matches:
 
             if args.join and next_:
-                
-                iabs2, tok2, search_obj2 = next_
-                
-                res = match + (search_obj2[0] if args.only else tok2['tok'])
-    
-                res += ' %d:%d:%d,%d:%d,%d:%d:%d,%d %d:%d:%d,%d:%d,%d:%d:%d,%d' % (
-                        tok['sura'], tok['vers'], tok['word'],
-                        tok['mpage'], tok['mword'], 
-                        tok['cpage'], tok['cline'], tok['cword'],
-                        iabs,
-                        tok2['sura'], tok2['vers'], tok2['word'],
-                        tok2['mpage'], tok2['mword'], 
-                        tok2['cpage'], tok2['cline'], tok2['cword'],
-                        iabs2)
-    
+                res = f'{match}{match2} {idx} {idx2}'
+
+            elif next_:
+                res = f'{match} {idx} {match2} {idx2}'
+
             else:
-    
-                res = '%s %d:%d:%d,%d:%d,%d:%d:%d,%d' % (match,
-                        tok['sura'], tok['vers'], tok['word'],
-                        tok['mpage'], tok['mword'], 
-                        tok['cpage'], tok['cline'], tok['cword'],
-                        iabs)
-    
-                if next_:
-                    iabs, tok, found = next_
-                    match = found[0] if args.only else tok['tok']
-                    res += ' %s %d:%d:%d,%d:%d,%d:%d:%d,%d' % (match,
-                        tok['sura'], tok['vers'], tok['word'],
-                        tok['mpage'], tok['mword'], 
-                        tok['cpage'], tok['cline'], tok['cword'],
-                        iabs)
-    
-            print(res, file=args.outfile)
+                res = f'{match} {idx}'
+
+            buf.append(res + '\n')
+            if len(buf) >= OUT_BATCH:
+                args.outfile.writelines(buf)
+                buf.clear()
+
+    args.outfile.writelines(buf)
 
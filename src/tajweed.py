@@ -45,8 +45,17 @@ import io
 import re
 import sys
 import ujson as json
-from copy import deepcopy
-from functools import partial
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import re2
+except ImportError:
+    re2 = None
+from collections import defaultdict
+from functools import partial, lru_cache
+from multiprocessing import Pool
 from argparse import ArgumentParser, FileType
 
 from rasm import rasm
@@ -64,16 +73,25 @@ IKHFA2 = 'تثجدذزسشصضطظفقك'  # حروف الإخفاء
     
 CONS = f'ب{ITHHAR}{IDGHAM}{IKHFA2}'
 
+SUN = 'طثصرتضذندسظزشل'          # الحروف الشمسية ; lam assimilates to these (cf. SHMS rule)
+
+# frozenset views of the character classes for O(1) membership pre-screens
+ITHHAR_SET = frozenset(ITHHAR)
+IDGHAM_SET = frozenset(IDGHAM)
+IKHFA2_SET = frozenset(IKHFA2)
+CONS_SET = frozenset(CONS)
+SUN_SET = frozenset(SUN)
+
 QSTOPS_REGEX = re.compile(r'[ۖۗۘۙۚۛ]')
 
-MADD_HMZ_EXCEPTION = {(2,72,4)}
+MADD_HMZ_EXCEPTION = frozenset({(2,72,4)})
 
-EXCLUDE_INDEXES_MIN_Y_2 = {(5,81,5), (7,158,23) , (9,113,3), (9,117,5), (33,30,2), (33,32,2), (33,38,4), (33,50,33), (33,53,7), (33,56,6), (49,2,9)}
+EXCLUDE_INDEXES_MIN_Y_2 = frozenset({(5,81,5), (7,158,23) , (9,113,3), (9,117,5), (33,30,2), (33,32,2), (33,38,4), (33,50,33), (33,53,7), (33,56,6), (49,2,9)})
 
-EXCLUDE_INDEXES_SIL_1 = {(2,160,9), (9,94,13), (15,49,5), (15,89,3), (20,13,1), (20,14,2), (27,9,3), (28,30,16)}
-EXCLUDE_INDEXES_SIL_5 = {(7,189,22)}
+EXCLUDE_INDEXES_SIL_1 = frozenset({(2,160,9), (9,94,13), (15,49,5), (15,89,3), (20,13,1), (20,14,2), (27,9,3), (28,30,16)})
+EXCLUDE_INDEXES_SIL_5 = frozenset({(7,189,22)})
 
-MITHL_yy_EXCLUDE_INDEXES = {(51,47,3)}
+MITHL_yy_EXCLUDE_INDEXES = frozenset({(51,47,3)})
 
 # فِیهِۦ Q.25:69:7
 # أُحۡیِۦ Q.2:258:22
@@ -91,8 +109,8 @@ MITHL_yy_EXCLUDE_INDEXES = {(51,47,3)}
 # فَیَسۡتَحۡیِۦ Q.33:53:32
 # یَسۡتَحۡیِۦ Q.33:53:36
 # وَلِیِّۦ Q.12:101:15
-RESTRICT_INDEXES_MIN_Y_4 = {(25,69,7), (2,258,22), (15,23,3), (50,43,3), (30,24,11), (7,103,9), (10,75,9), (11,97,3), (23,46,3), (43,46,7), (28,32,21),
-                            (7,127,17), (28,4,14), (33,53,32), (33,53,36), (12,101,15)}
+RESTRICT_INDEXES_MIN_Y_4 = frozenset({(25,69,7), (2,258,22), (15,23,3), (50,43,3), (30,24,11), (7,103,9), (10,75,9), (11,97,3), (23,46,3), (43,46,7), (28,32,21),
+                            (7,127,17), (28,4,14), (33,53,32), (33,53,36), (12,101,15)})
 
 
 # لِلۡحَوَارِیِّۧنَ Q.61:14:12
@@ -101,23 +119,23 @@ RESTRICT_INDEXES_MIN_Y_4 = {(25,69,7), (2,258,22), (15,23,3), (50,43,3), (30,24,
 # وَٱلۡأُمِّیِّۧنَ  Q.3:20:13
 # ٱلۡأُمِّیِّۧنَ   Q.3:75:30
 # رَبَّٰنِیِّۧنَ    Q.3:79:21
-RESTRICT_INDEXES_MIN_5 = {(61,14,12), (62,2,5), (5,111,4), (3,20,13), (3,75,30), (3,79,21)}
+RESTRICT_INDEXES_MIN_5 = frozenset({(61,14,12), (62,2,5), (5,111,4), (3,20,13), (3,75,30), (3,79,21)})
 
-RESTRICT_INDEXES_SIL_6 = {(5,18,5), (20,18,4), (26,6,4), (6,5,8), (60,4,14), (20,119,3), (12,85,3), (59,17,9), (5,29,12), (5,33,2), (40,50,12),
+RESTRICT_INDEXES_SIL_6 = frozenset({(5,18,5), (20,18,4), (26,6,4), (6,5,8), (60,4,14), (20,119,3), (12,85,3), (59,17,9), (5,29,12), (5,33,2), (40,50,12),
   (42,21,3), (6,94,21), (30,13,6), (26,197,7), (14,21,5), (40,47,6), (35,28,13), (23,24,2), (27,29,3), (27,32,3), (27,38,3), (10,34,12), (10,34,6), (10,4,8),
-  (27,64,2), (30,11,2), (30,27,3), (16,48,9), (25,77,3), (75,13,1), (43,18,2), (14,9,3), (38,21,4), (64,5,3), (11,87,16), (24,8,1), (37,106,4), (42,40,1)}
+  (27,64,2), (30,11,2), (30,27,3), (16,48,9), (25,77,3), (75,13,1), (43,18,2), (14,9,3), (38,21,4), (64,5,3), (11,87,16), (24,8,1), (37,106,4), (42,40,1)})
 
-RESTRICT_INDEXES_SIL_7 = {(20,84,3), (3,119,2), (65,6,13), (11,116,7), (13,19,15), (14,52,12), (24,22,3), (27,33,3), (2,269,15), (38,29,8), (39,18,12),
+RESTRICT_INDEXES_SIL_7 = frozenset({(20,84,3), (3,119,2), (65,6,13), (11,116,7), (13,19,15), (14,52,12), (24,22,3), (27,33,3), (2,269,15), (38,29,8), (39,18,12),
   (39,9,23), (3,7,45), (46,35,4), (4,8,4), (9,86,11), (17,5,9), (24,22,9), (24,31,51), (28,76,18), (35,1,13), (38,45,6), (48,16,8), (4,83,15), (4,95,7), (73,11,3),
   (9,113,11), (21,37,5), (7,145,18), (12,111,6), (20,128,16), (20,54,8), (24,44,9), (38,43,9), (39,21,30), (3,13,28), (3,190,10), (40,54,3), (65,4,15), (27,33,5),
-  (33,6,8), (3,18,9), (8,75,10), (4,59,8), (2,179,5), (2,197,28), (59,2,39), (5,100,12), (65,10,8)}
+  (33,6,8), (3,18,9), (8,75,10), (4,59,8), (2,179,5), (2,197,28), (59,2,39), (5,100,12), (65,10,8)})
 
-RESTRICT_INDEXES_MIN_U_7 = {(4,135,30), (18,16,7)}
+RESTRICT_INDEXES_MIN_U_7 = frozenset({(4,135,30), (18,16,7)})
 
-RESTRICT_INDEXES_SIL_8 = {(8,65,17), (8,66,12), (18,25,5), (24,2,7), (2,259,19), (2,259,35), (2,261,16), (37,147,3), (8,65,13), (8,66,15)}
-RESTRICT_INDEXES_SIL_9 = {(21,34,7), (3,144,10), (6,34,21), (10,75,9), (11,97,3), (23,46,3), (28,32,21), (43,46,7), (7,103,9), (10,83,12)}
-RESTRICT_INDEXES_SIL_A = {(43,13,1), (11,68,7), (76,4,4), (76,16,1), (4,135,30), (18,16,7), (2,275,20), (2,275,25), (2,275,3), (2,276,3), (2,278,10),
-  (3,130,6), (4,161,2), (25,38,2), (29,38,2), (53,51,1), (18,14,12), (47,31,7), (47,4,28), (30,39,5), (13,30,10), (38,67,3), (44,33,6), (4,176,8)}
+RESTRICT_INDEXES_SIL_8 = frozenset({(8,65,17), (8,66,12), (18,25,5), (24,2,7), (2,259,19), (2,259,35), (2,261,16), (37,147,3), (8,65,13), (8,66,15)})
+RESTRICT_INDEXES_SIL_9 = frozenset({(21,34,7), (3,144,10), (6,34,21), (10,75,9), (11,97,3), (23,46,3), (28,32,21), (43,46,7), (7,103,9), (10,83,12)})
+RESTRICT_INDEXES_SIL_A = frozenset({(43,13,1), (11,68,7), (76,4,4), (76,16,1), (4,135,30), (18,16,7), (2,275,20), (2,275,25), (2,275,3), (2,276,3), (2,278,10),
+  (3,130,6), (4,161,2), (25,38,2), (29,38,2), (53,51,1), (18,14,12), (47,31,7), (47,4,28), (30,39,5), (13,30,10), (38,67,3), (44,33,6), (4,176,8)})
 
 
 REMOVE_SANDHI_RULES = [
@@ -464,9 +482,658 @@ RESTORE_SANDHI_RULES = [
   ('MADD-sp-D', ((None, None), (None, None)), (r'^ن$', 'نٓ'), None, {}, {}, {}, {}),
 ]
 
+_META_CHARS = frozenset(r'\[](){}^$?*+|.')
+
+# rules triggered by a single character from a small class; the regex is only
+# entered when the token contains at least one character of the class
+RULE_CLASS_GATES = {'SHMS': SUN_SET, 'MADD-lzm': CONS_SET, 'N4.A': IKHFA2_SET}
+
+def _shms_scan_rm(tok, _sun=SUN_SET):
+    """ explicit scan for the lam + sun letter + shadda trigger of SHMS when removing.
+
+    The rule is really a table lookup on the character after the lam, so the
+    trigger is detected with three plain character reads per lam and the regex
+    is only entered when the trigger sequence is present.
+
+    Args:
+        tok (str): quranic token.
+
+    Return:
+        bool: True if the trigger sequence occurs in tok.
+
+    """
+    i = tok.find('ل')
+    while i != -1:
+        if tok[i+1:i+2] in _sun and tok[i+2:i+3] == 'ّ':
+            return True
+        i = tok.find('ل', i+1)
+    return False
+
+def _shms_scan_add(tok, _sun=SUN_SET):
+    """ explicit scan for the lam + sukun + sun letter trigger of SHMS when restoring.
+
+    Args:
+        tok (str): quranic token.
+
+    Return:
+        bool: True if the trigger sequence occurs in tok.
+
+    """
+    i = tok.find('لۡ')
+    while i != -1:
+        if tok[i+2:i+3] in _sun:
+            return True
+        i = tok.find('لۡ', i+2)
+    return False
+
+def _literal_needle(pat):
+    """ return pat when it is a plain literal without regex metacharacters, else None.
+
+    Args:
+        pat (str): raw inside pattern of a rule, or None.
+
+    Return:
+        str: literal needle usable as a substring pre-check, or None.
+
+    """
+    if pat and _META_CHARS.isdisjoint(pat):
+        return pat
+    return None
+
+def _post_first_chars(pat):
+    """ derive the characters the next token can start with for a TOK_POST
+    pattern to match, or None when the pattern is too complex to decide.
+
+    The post patterns of the tables are simple enough — a literal start, a
+    character class or an alternation of those, possibly inside a group or a
+    lookahead — that the possible first characters can be read off the pattern.
+
+    Args:
+        pat (str): raw TOK_POST pattern of a rule, or None.
+
+    Return:
+        frozenset: possible first characters of the next token, or None.
+
+    """
+    if pat is None:
+        return None
+    if pat[0] == '(':
+        inner = pat[1:]
+        if inner[:2] in ('?:', '?='):
+            inner = inner[2:]
+        inner = inner[:inner.rindex(')')]
+        chars = set()
+        for alt in inner.split('|'):
+            first = _post_first_chars(alt)
+            if first is None:
+                return None
+            chars.update(first)
+        return frozenset(chars)
+    if pat[0] == '[':
+        if pat[1] == '^':
+            return None
+        return frozenset(pat[1:pat.index(']')])
+    if pat[0] == '\\':
+        return None
+    return frozenset(pat[0])
+
+def _extract_exact_rules(rules):
+    """ pop the safe full-token literal rules out of a raw table into a dict.
+
+    A rule whose inside pattern is ^literal$ with a literal replacement and no
+    boundary part or condition maps one exact token to another, so those of
+    them that qualify (most of the MADD-sp-* series) collapse into a single
+    dict lookup per token.
+
+    The lookup runs before the sequential rules, so a rule is only extracted
+    when no earlier rule of the table can match its literal or its
+    replacement; otherwise an earlier rule would see the replacement it never
+    sees in the sequential application — N2.1.2.A consumed the replacement of
+    MADD-sp-D at Q.68:1:5, turning the restored نٓ into نۡ. The unsafe rules
+    simply stay in the table at their original position.
+
+    Args:
+        rules (list): raw rule table (REMOVE_SANDHI_RULES or RESTORE_SANDHI_RULES).
+
+    Return:
+        dict, list: mapping of token to id_rule, replacement pair, and the
+            remaining rules.
+
+    """
+    def clashes(k, tok):
+        # an earlier inside pattern, or an earlier TOK_PRE anchored to the end
+        # of the token, that can match tok would run after the lookup instead
+        # of before it, as it does in the sequential application
+        for _, ((tok_pre, _), _), (pat, _), *_ in rules[:k]:
+            if pat is not None and re.search(pat, tok) is not None:
+                return True
+            if tok_pre is not None and re.search(f'{tok_pre}$', tok) is not None:
+                return True
+        return False
+
+    exact, rest = {}, []
+    for k, rule in enumerate(rules):
+        id_rule, ((tok_pre, _), _), (pat, repl), FILTER_POS, except_ind, _, _, restrict_ind = rule
+        if (pat and pat.startswith('^') and pat.endswith('$') and _literal_needle(pat[1:-1])
+                and repl and '\\' not in repl
+                and tok_pre is None and not FILTER_POS and not except_ind and not restrict_ind
+                and not clashes(k, pat[1:-1]) and not clashes(k, repl)):
+            # interned key, so the lookup of an interned corpus token resolves
+            # by pointer equality
+            exact[sys.intern(pat[1:-1])] = (id_rule, repl)
+        else:
+            rest.append(rule)
+    return exact, rest
+
+def _charmask(s):
+    """ fold the characters of s into a 64-bit presence mask.
+
+    Two distinct characters can share a bit, so the mask can only prove
+    absence, never presence — exactly what a prefilter needs.
+
+    Args:
+        s (str): string to fold.
+
+    Return:
+        int: 64-bit mask with a bit per character of s.
+
+    """
+    mask = 0
+    for c in s:
+        mask |= 1 << (ord(c) & 63)
+    return mask
+
+def _pack_indexes(indexes):
+    """ pack (sura, verse, word) indexes as single ints for cheap membership tests.
+
+    Each component fits in 10 bits, so an index packs as sura<<20 | verse<<10 |
+    word; hashing a small int is its identity, which makes the per-token
+    membership checks cheaper than hashing a tuple of three ints.
+
+    Args:
+        indexes (iterable): (sura, verse, word) triples.
+
+    Return:
+        frozenset: packed indexes.
+
+    """
+    return frozenset(s<<20 | v<<10 | w for s, v, w in indexes)
+
+def _compile_rules(rules):
+    """ compile the regex patterns of a rule table once at import.
+
+    TOK_PRE is anchored to the end of the first token and TOK_POST to the
+    beginning of the second, so the applier does not have to rebuild the
+    anchored patterns for every token. The index sets are normalised to
+    frozensets of packed ints (cf. _pack_indexes), so the `{}` placeholders of
+    the raw tables become empty frozensets with a cheap falseness check and no
+    accidental mutation.
+
+    Args:
+        rules (list): raw rule table (REMOVE_SANDHI_RULES or RESTORE_SANDHI_RULES).
+
+    Return:
+        list: rule table with all patterns as compiled regexes.
+
+    """
+    return [(id_rule,
+             ((re.compile(f'{tok_pre}$') if tok_pre else None,
+               re.compile(f'^{tok_post}') if tok_post else None,
+               _post_first_chars(tok_post),
+               _literal_needle(tok_pre), _literal_needle(tok_post)),
+              (repl_pre, repl_post)),
+             (re.compile(pat) if pat else None, repl, _literal_needle(pat),
+              _literal_needle(pat) is not None and repl is not None and '\\' not in repl,
+              RULE_CLASS_GATES.get(id_rule),
+              # the two directions of SHMS share the rule id but differ in
+              # their trigger sequence, so the scan is chosen by the pattern
+              (_shms_scan_add if 'ۡ' in pat else _shms_scan_rm) if id_rule == 'SHMS' else None),
+             FILTER_POS, _pack_indexes(except_ind), frozenset(except_lemas),
+             _pack_indexes(force_ind), _pack_indexes(restrict_ind))
+            for id_rule, ((tok_pre, tok_post), (repl_pre, repl_post)), (pat, repl),
+                FILTER_POS, except_ind, except_lemas, force_ind, restrict_ind in rules]
+
+REMOVE_EXACT, _REMOVE_REST = _extract_exact_rules(REMOVE_SANDHI_RULES)
+RESTORE_EXACT, _RESTORE_REST = _extract_exact_rules(RESTORE_SANDHI_RULES)
+
+COMPILED_REMOVE_RULES = _compile_rules(_REMOVE_REST)
+COMPILED_RESTORE_RULES = _compile_rules(_RESTORE_REST)
+
+def _fuse_inside_rules(rules):
+    """ fuse the leading unconditioned inside rules into a single alternation.
+
+    An inside rule without POS filter, excluded indexes, restricted indexes or
+    boundary part fires on its pattern alone, so a run of such patterns can be
+    matched in one scan per token instead of one scan per rule. Each pattern is
+    wrapped in a named group and the backreferences of its replacement are
+    shifted to the group numbers it gets inside the alternation.
+
+    Only the maximal prefix of the table is fused. The fused pass runs before
+    the residual table, so hoisting a later rule over an earlier residual one
+    would invert their order: the earlier rule could lose its match to the
+    hoisted rewrite (P-sil-1 no longer saw its sukun spelling once MTJNS-lr had
+    jumped ahead of it) or lose its credit in the counts (MITHL-ll stealing the
+    firings of SHMS on the same shadda). Within the prefix the rules keep their
+    table order as alternatives, so when two patterns compete at the same
+    position the earlier rule wins, and every residual rule still runs after
+    the whole prefix, as in the sequential application.
+
+    Rules with a POS filter or an index condition could not be fused anywhere
+    anyway: the fused pass is memoized by token alone, so a rule whose firing
+    depends on the quranic index would poison the cache.
+
+    Args:
+        rules (list): compiled rule table (cf. _compile_rules).
+
+    Return:
+        Pattern, dict, list: fused alternation (None if no leading rule is
+            fusable), mapping of group name to id_rule, shifted replacement
+            pair, and residual rule table for the sequential applier.
+
+    """
+    parts, info = [], {}
+    ngroups = 0
+    for rule in rules:
+        id_rule, bound, (pat, repl, needle, lit, class_gate, scan_gate), FILTER_POS, except_ind, except_lemas, force_ind, restrict_ind = rule
+
+        if pat is None or bound[0][0] is not None or FILTER_POS or except_ind or restrict_ind:
+            break
+
+        # rule ids contain chars that are not valid in group names
+        name = f'r{len(parts)}'
+        shift = ngroups + 1
+        shifted_repl = re.sub(r'\\(\d+)', lambda m: f'\\{int(m.group(1)) + shift}', repl)
+
+        parts.append(f'(?P<{name}>{pat.pattern})')
+        info[name] = (id_rule, shifted_repl)
+        ngroups += pat.groups + 1
+
+    return (re.compile('|'.join(parts)) if parts else None), info, rules[len(parts):]
+
+REMOVE_FUSED, REMOVE_FUSED_INFO, REMOVE_RESIDUAL_RULES = _fuse_inside_rules(COMPILED_REMOVE_RULES)
+RESTORE_FUSED, RESTORE_FUSED_INFO, RESTORE_RESIDUAL_RULES = _fuse_inside_rules(COMPILED_RESTORE_RULES)
+
+# the tanwin variants of the N2/N3/N4 families share one shape — a tanwin sign
+# at the end of the token, optionally followed by a silent letter — so a single
+# alternation of their TOK_PRE patterns decides once per token whether any of
+# them can fire, instead of one anchored search per rule
+TANWIN_RULES = frozenset({'N2.1.1.B', 'N2.1.1.C', 'N2.1.1.D',
+                          'N2.1.2.B', 'N2.1.2.C', 'N2.1.2.D',
+                          'N2.2.B', 'N2.2.C', 'N2.2.D',
+                          'N3.B', 'N3.C', 'N3.D',
+                          'N4.B', 'N4.C', 'N4.D'})
+
+@lru_cache(maxsize=None)
+def _wordform_rasm(tok):
+    """ rasm skeleton of a wordform, memoized by token.
+
+    Only the HU/HI clitic rules consume the rasm, so it is computed lazily in
+    their root checks instead of once per token, and cached because the corpus
+    repeats the same wordforms thousands of times.
+
+    Args:
+        tok (str): quranic token.
+
+    Return:
+        str: rasm skeleton of tok.
+
+    """
+    return next(rasm(io.StringIO(tok)))[-1]
+
+class RuleTable:
+    """ residual rule table in a structure-of-arrays layout.
+
+    One tuple per column, indexed by rule number, so each path of the applier
+    only reads the columns it needs instead of unpacking the whole nested rule
+    tuple for every token.
+
+    """
+
+    __slots__ = ('n', 'ids', 'pre', 'post', 'post_first', 'pre_lit', 'post_lit',
+                 'repl_pre', 'repl_post', 'pat', 'repl', 'needle', 'lit',
+                 'class_gate', 'scan_gate', 'filter_pos', 'exclude', 'force',
+                 'restrict', 'trigger', 'trigger_table', 'charmask',
+                 'is_tanwin', 'tanwin_gate', 'fns', 'fns_dbg', 'run', 'run_dbg')
+
+    def __init__(self, rules):
+        self.n = len(rules)
+        # interned ids, so the counts dict keyed by them hashes by pointer
+        self.ids = tuple(sys.intern(r[0]) for r in rules)
+        self.pre = tuple(r[1][0][0] for r in rules)
+        self.post = tuple(r[1][0][1] for r in rules)
+        self.post_first = tuple(r[1][0][2] for r in rules)
+        self.pre_lit = tuple(r[1][0][3] for r in rules)
+        self.post_lit = tuple(r[1][0][4] for r in rules)
+        self.repl_pre = tuple(r[1][1][0] for r in rules)
+        self.repl_post = tuple(r[1][1][1] for r in rules)
+        self.pat = tuple(r[2][0] for r in rules)
+        self.repl = tuple(r[2][1] for r in rules)
+        self.needle = tuple(r[2][2] for r in rules)
+        self.lit = tuple(r[2][3] for r in rules)
+        self.class_gate = tuple(r[2][4] for r in rules)
+        self.scan_gate = tuple(r[2][5] for r in rules)
+        self.filter_pos = tuple(r[3] for r in rules)
+        self.exclude = tuple(r[4] for r in rules)
+        self.force = tuple(r[6] for r in rules)
+        self.restrict = tuple(r[7] for r in rules)
+
+        # rules whose TOK_PRE is one literal character get a trigger bit; a token
+        # without that character anywhere cannot match the anchored pattern, so
+        # the applier ORs the bits of all its characters once and skips the rule
+        # families whose bit is missing
+        trigger, table = [], {}
+        for k, p in enumerate(self.pre):
+            raw = p.pattern[:-1] if p is not None else None
+            if raw is not None and len(raw) == 1 and raw not in _META_CHARS:
+                bit = 1 << k
+                table[raw] = table.get(raw, 0) | bit
+                trigger.append(bit)
+            else:
+                trigger.append(0)
+        self.trigger = tuple(trigger)
+        self.trigger_table = table
+
+        # character masks for the inside-only rules with a literal needle: the
+        # token mask is folded once per token and a rule whose needle has a
+        # bit the token lacks cannot match. A replacement of an earlier rule
+        # can add characters to the token mid-loop, so only the needle
+        # characters that no replacement of the table can introduce go into
+        # the mask — if one of those is absent, the needle can never appear
+        introduced = set()
+        for s in self.repl_pre + self.repl:
+            if s:
+                introduced.update(re.sub(r'\\.', '', s))
+        self.charmask = tuple(_charmask(''.join(c for c in self.needle[k] if c not in introduced))
+                              if self.needle[k] and self.pre[k] is None
+                              else 0
+                              for k in range(self.n))
+
+        # combined gate for the tanwin families (cf. TANWIN_RULES); the
+        # alternation keeps the end-of-token anchors of the member patterns.
+        # The gate is probed once per token before the rules run, so — as with
+        # the character masks above — a rule is only gated when no replacement
+        # of an earlier rule in the table can introduce a character of its
+        # precondition: on restore, Sil-9 appends ۟ and only then does the
+        # ٌ(ا۟)? of N2.1.1.C match (بَلَٰٓؤࣱا۟, 44:33:6), so the C family
+        # stays ungated and rechecks its own pattern on the live token
+        introduced_before = set()
+        is_tanwin, tanwin_pats = [], []
+        for k in range(self.n):
+            gated = (self.ids[k] in TANWIN_RULES
+                     and introduced_before.isdisjoint(self.pre[k].pattern))
+            is_tanwin.append(gated)
+            if gated:
+                tanwin_pats.append(self.pre[k].pattern)
+            for s in (self.repl_pre[k], self.repl[k]):
+                if s:
+                    introduced_before.update(re.sub(r'\\.', '', s))
+        self.is_tanwin = tuple(is_tanwin)
+        tanwin_pats = list(dict.fromkeys(tanwin_pats))
+        self.tanwin_gate = re.compile('|'.join(tanwin_pats)) if tanwin_pats else None
+
+        self.fns = tuple(self._specialise(k, dbg=False) for k in range(self.n))
+        self.fns_dbg = tuple(self._specialise(k, dbg=True) for k in range(self.n))
+        self.run = self._build_driver(self.fns)
+        self.run_dbg = self._build_driver(self.fns_dbg)
+
+    def _specialise(self, k, dbg):
+        """ generate a specialised applier function for rule k.
+
+        The source of the function is templated at import with only the checks
+        the rule actually needs: fields that are None and index sets that are
+        empty simply do not appear in the generated code, instead of being
+        re-tested for every one of the 78k tokens (partial evaluation). The
+        trace printing gets the same treatment: the production variant (dbg
+        False) is generated without the debug branches altogether, and
+        apply_rules picks fns or fns_dbg up front.
+
+        Args:
+            k (int): rule number.
+            dbg (bool): generate the variant with the trace printing.
+
+        Return:
+            function: applier fn(tokens, i, ntokens, ind_pk, morf, counts,
+                debug), where ind_pk is the packed quranic index of token i
+                (cf. _pack_indexes) and morf its qmorf entry, fetched once per
+                token by the applier.
+
+        """
+        ns = {'sys': sys,
+              'ID': self.ids[k], 'FILTER': self.filter_pos[k],
+              'RESTRICT': self.restrict[k], 'EXCLUDE': self.exclude[k], 'FORCE': self.force[k],
+              'PRE': self.pre[k], 'POST': self.post[k], 'POST_FIRST': self.post_first[k],
+              'REPL_PRE': self.repl_pre[k], 'REPL_POST': self.repl_post[k],
+              'PAT': self.pat[k], 'REPL': self.repl[k], 'NEEDLE': self.needle[k],
+              'CLASS_GATE': self.class_gate[k], 'SCAN_GATE': self.scan_gate[k]}
+
+        lines = ['def fn(tokens, i, ntokens, ind_pk, morf, counts, debug):']
+        add = lambda indent, line: lines.append('    '*(indent+1) + line)
+
+        if self.restrict[k]:
+            add(0, 'if ind_pk not in RESTRICT: return')
+        if self.exclude[k]:
+            add(0, 'if ind_pk in EXCLUDE: return')
+        if self.filter_pos[k]:
+            add(0, "if FILTER not in morf['pos']: return")
+
+        if self.ids[k] in ('HU', 'HI'):
+            ns['DIFF_IND'] = 2<<20 | 237<<10 | 21
+            ns['WORDFORM'] = _wordform_rasm
+            # madd rule for enclitic -h should not be applied to final -h
+            # belonging to lemma (roots in -h, or in -hy like the verbal
+            # final -h of 19:46:9); the root endings come precomputed as
+            # flags from _qmorf_index
+            add(0, 'if ind_pk not in FORCE:')
+            add(1, "if morf['roots_end_h'] or morf['roots_end_hy']:")
+            add(2, 'wr = WORDFORM(tokens[i][0])')
+            add(2, "if wr[-2:] != '\u0647\u0647':")
+            add(3, "if ind_pk == DIFF_IND: print('diff 1' if morf['roots_end_h'] else 'diff 2', morf, wr) #FIXME")
+            add(3, 'return')
+
+        if self.pre[k] is not None:
+            # boundary parts that are plain literals skip the engine: the
+            # anchors turn the pre into an endswith plus a slice and the post
+            # into a startswith
+            pre_fast = self.pre_lit[k] is not None and self.repl_pre[k] is not None and '\\' not in self.repl_pre[k]
+            post_fast = self.post_lit[k] is not None
+            if pre_fast:
+                ns['PRE_LIT'], ns['PRE_CUT'] = self.pre_lit[k], len(self.pre_lit[k])
+            if post_fast:
+                ns['POST_LIT'], ns['POST_CUT'] = self.post_lit[k], len(self.post_lit[k])
+            cond = 'if i<ntokens-1'
+            if post_fast:
+                cond += ' and tokens[i+1][0].startswith(POST_LIT):'
+            else:
+                if self.post_first[k] is not None:
+                    cond += ' and tokens[i+1][0][:1] in POST_FIRST'
+                cond += ' and POST.search(tokens[i+1][0]):'
+            add(0, cond)
+            if pre_fast:
+                # the end anchor allows one match at most
+                add(1, 'cur, cnt = (tokens[i][0][:-PRE_CUT] + REPL_PRE, 1) if tokens[i][0].endswith(PRE_LIT) else (tokens[i][0], 0)')
+            else:
+                # subn tests and rewrites the current token in one engine pass
+                # and reports the count itself, instead of a search followed by
+                # a second pass for the replacement; the corpus repeats the
+                # same wordforms thousands of times and the rewrite depends on
+                # the token alone, so the result is memoized by token
+                ns['PRE_SUBN'] = lru_cache(maxsize=1<<16)(partial(self.pre[k].subn, self.repl_pre[k]))
+                add(1, 'cur, cnt = PRE_SUBN(tokens[i][0])')
+            add(1, 'if cnt:')
+            add(2, 'if counts != None: counts[ID].append((tokens[i][1], cnt, True))')
+            if self.repl_post[k]:
+                if post_fast and '\\' not in self.repl_post[k]:
+                    add(2, 'nxt = REPL_POST + tokens[i+1][0][POST_CUT:]')
+                else:
+                    add(2, 'nxt = POST.sub(REPL_POST, tokens[i+1][0])')
+                if dbg:
+                    add(2, "print(f'[[DEBUG::BND.2]] id_rule={ID} {tokens[i][1]} ori={tokens[i][0]} (next={tokens[i+1][0]}) '")
+                    add(2, "      f'new={cur} (next={nxt}) cnt={cnt} filter={FILTER}', file=sys.stderr) #TRACE")
+                add(2, 'tokens[i+1][0] = nxt')
+            elif dbg:
+                add(2, "print(f'[[DEBUG::BND.1]] id_rule={ID} {tokens[i][1]} ori={tokens[i][0]} (next={tokens[i+1][0]}) '")
+                add(2, "      f'new={cur} cnt={cnt} filter={FILTER}', file=sys.stderr) #TRACE")
+            add(2, 'tokens[i][0] = cur')
+
+        if self.pat[k] is not None:
+            gates = []
+            if self.needle[k] is not None:
+                gates.append('NEEDLE in tokens[i][0]')
+            if self.scan_gate[k] is not None:
+                # the scan already checks the full trigger sequence, so it
+                # replaces the weaker character-class gate
+                gates.append('SCAN_GATE(tokens[i][0])')
+            elif self.class_gate[k] is not None:
+                gates.append('not CLASS_GATE.isdisjoint(tokens[i][0])')
+            depth = 0
+            if gates:
+                add(0, 'if %s:' % ' and '.join(gates))
+                depth = 1
+            if self.lit[k]:
+                add(depth, 'cnt = tokens[i][0].count(NEEDLE)')
+                add(depth, 'cur = tokens[i][0].replace(NEEDLE, REPL)')
+            else:
+                add(depth, 'cur, cnt = PAT.subn(REPL, tokens[i][0])')
+            if dbg:
+                add(depth, 'if cnt:')
+                add(depth+1, "print(f'[[DEBUG::INSID]] id_rule={ID} {tokens[i][1]} ori={tokens[i][0]} new={cur} cnt={cnt} filter={FILTER}', file=sys.stderr) #TRACE")
+            add(depth, 'tokens[i][0] = cur')
+            add(depth, 'if counts != None and cnt: counts[ID].append((tokens[i][1], cnt, False))')
+
+        if len(lines) == 1:
+            add(0, 'pass')
+
+        exec('\n'.join(lines), ns)
+        return ns['fn']
+
+    def _build_driver(self, fns):
+        """ generate the unrolled per-token driver over all rules of the table.
+
+        The generic loop pays a tuple index per column per rule to fetch the
+        trigger bits, the tanwin flag and the character mask; here the loop is
+        unrolled at import with the gates of every rule inlined as constants,
+        and rules without any gate are called directly.
+
+        Args:
+            fns (tuple): specialised appliers to dispatch to (cf. _specialise).
+
+        Return:
+            function: driver run(tokens, i, ntokens, ind_pk, morf, features,
+                tok_mask, tanwin_tail, counts, debug), where features and
+                tok_mask are the folded trigger bits and character mask of
+                token i and tanwin_tail its tanwin gate result.
+
+        """
+        ns = {f'fn_{k}': fns[k] for k in range(self.n)}
+
+        lines = ['def run(tokens, i, ntokens, ind_pk, morf, features, tok_mask, tanwin_tail, counts, debug):']
+        for k in range(self.n):
+            conds = []
+            if self.trigger[k]:
+                conds.append(f'features & {self.trigger[k]}')
+            if self.is_tanwin[k]:
+                conds.append('tanwin_tail')
+            if self.charmask[k]:
+                conds.append(f'not {self.charmask[k]} & ~tok_mask')
+            call = f'fn_{k}(tokens, i, ntokens, ind_pk, morf, counts, debug)'
+            lines.append(f'    if {" and ".join(conds)}: {call}' if conds else f'    {call}')
+
+        exec('\n'.join(lines), ns)
+        return ns['run']
+
+REMOVE_TABLE = RuleTable(REMOVE_RESIDUAL_RULES)
+RESTORE_TABLE = RuleTable(RESTORE_RESIDUAL_RULES)
+
+FUSED_TABLES = {'rm': (REMOVE_FUSED, REMOVE_FUSED_INFO), 'add': (RESTORE_FUSED, RESTORE_FUSED_INFO)}
+
+def _group_owners(fused_pat, fused_info):
+    """ map every group number of a fused alternation to its owning rule.
+
+    Whichever group of the winning alternative matched last, its number falls
+    between the number of the alternative's named group and the number of the
+    next one, so a flat array indexed by m.lastindex resolves the rule in one
+    load instead of probing each named group of the pattern in turn.
+
+    Args:
+        fused_pat (Pattern): fused alternation (cf. _fuse_inside_rules), or None.
+        fused_info (dict): group name to id_rule, replacement mapping.
+
+    Return:
+        tuple: id_rule, replacement pair for each group number.
+
+    """
+    if fused_pat is None:
+        return ()
+    owners = [None] * (fused_pat.groups + 1)
+    for name, num in sorted(fused_pat.groupindex.items(), key=lambda x: x[1]):
+        if name in fused_info:
+            owners[num:] = [fused_info[name]] * (len(owners) - num)
+    return tuple(owners)
+
+FUSED_OWNERS = {'rm': _group_owners(REMOVE_FUSED, REMOVE_FUSED_INFO),
+                'add': _group_owners(RESTORE_FUSED, RESTORE_FUSED_INFO)}
+
+def _re2_prefilter(fused_pat):
+    """ linear-time existence probe for a fused alternation, or None.
+
+    The substitution itself stays on the stdlib engine — the alternation
+    relies on leftmost-first priority between rules, and the replacement
+    callback on its match objects — but whether any alternative matches at
+    all does not depend on the engine, so when re2 is available its
+    guaranteed O(n) scan decides if the sub needs to run.
+
+    Args:
+        fused_pat (Pattern): fused alternation (cf. _fuse_inside_rules).
+
+    Return:
+        re2 pattern usable for searching, or None.
+
+    """
+    if re2 is None or fused_pat is None:
+        return None
+    try:
+        return re2.compile(fused_pat.pattern)
+    except Exception:
+        # re2 rejects constructs it cannot run in linear time
+        return None
+
+FUSED_PREFILTERS = {'rm': _re2_prefilter(REMOVE_FUSED), 'add': _re2_prefilter(RESTORE_FUSED)}
+
+@lru_cache(maxsize=200_000)
+def _apply_fused(tok, table):
+    """ apply the fused alternation of a table to one token.
+
+    The quranic text repeats the same wordforms thousands of times and the fused
+    pass depends on the token alone, so the result is memoized by token.
+
+    Args:
+        tok (str): quranic token.
+        table (str): key of the fused table in FUSED_TABLES, 'rm' or 'add'.
+
+    Return:
+        str, tuple: modified token and id_rule, count pairs of the fired rules.
+
+    """
+    fused_pat, _ = FUSED_TABLES[table]
+    if fused_pat is None:
+        return tok, ()
+
+    prefilter = FUSED_PREFILTERS[table]
+    if prefilter is not None and prefilter.search(tok) is None:
+        return tok, ()
+    owners = FUSED_OWNERS[table]
+    fired = {}
+
+    def _repl(m):
+        id_rule, repl = owners[m.lastindex]
+        fired[id_rule] = fired.get(id_rule, 0) + 1
+        return m.expand(repl)
+
+    return fused_pat.sub(_repl, tok), tuple(fired.items())
+
 # indexes of special words that do not have harakat nor sukun even after removing tajweed and
 # consequently are excluded for that checking
-EXCEPTIONS_SUKUN = {(2,1,5), (3,1,5), (29,1,5), (30,1,5), (31,1,5), (32,1,5), # الٓمٓ
+EXCEPTIONS_SUKUN = frozenset({(2,1,5), (3,1,5), (29,1,5), (30,1,5), (31,1,5), (32,1,5), # الٓمٓ
                     (26,1,5), (28,1,5), # طسٓمٓ
                     (27,1,5), # طسٓ
                     (36,1,5), # یسٓ
@@ -483,8 +1150,82 @@ EXCEPTIONS_SUKUN = {(2,1,5), (3,1,5), (29,1,5), (30,1,5), (31,1,5), (32,1,5), #
                     (20,1,5), # طه
                     (39,69,7), (89,23,1),  # وَجِا۟یءَ Q.39:69:7 ; وَجِا۟یءَ Q.89:23:1
                     (51,47,3)  # بِأَیۡی۟دࣲ Q.51:47:3
+})
+
+# classifier of the --eval verification block: all the trace checks fused in
+# one named-group alternation, so each token is scanned once instead of once
+# per check; when a word has several traces only one of them is reported, as
+# in the old chain of checks. The second pattern leaves the sukun check out,
+# for the words of EXCEPTIONS_SUKUN
+_CHECKS = (f'(?P<sukun>[{CONS}](?<!ُو|ِی)[{CONS}])',
+           f'(?P<shadda>^[{CONS}]ّ)',
+           '(?P<tanwin>[ࣰࣱࣲ]|َۢ|ُۢ|ِۭ)',
+           '(?P<madd>[ٓآ])',
+           '(?P<sil_alif>۠)',
+           '(?P<min_y>[ۦۧ])',
+           '(?P<min_w>ۥ)',
+           '(?P<no_prnc>۟)',
+           '(?P<hapax_06ea>۪)',
+           '(?P<hapax_06eb>۫)',
+           '(?P<hapax_06ec>۬)',
+           '(?P<mim>ۢ)',
+           '(?P<sin>ۜ)')
+
+CHECK_REGEX = re.compile('|'.join(_CHECKS))
+CHECK_NOSUKUN_REGEX = re.compile('|'.join(_CHECKS[1:]))
+CHECK_SUKUN_SHADDA_REGEX = re.compile('|'.join(_CHECKS[:2]))
+
+# every check except sukun and shadda keys on one of these signs; deleting
+# them with translate runs in C, and an unchanged length proves that only the
+# two-branch scanner can still apply to the token
+CHECK_SPECIAL_TABLE = str.maketrans('', '', 'ࣰࣱࣲۭۢٓآ۠ۦۧۥ۪۟۫۬ۜ')
+
+CHECK_MESSAGES = {
+    'sukun':      ('1', 'consonant without harakat nor sukun'),
+    'shadda':     ('2', 'shadda on initial consonant of word'),
+    'tanwin':     ('3', 'tanwin with tajweed'),
+    'madd':       ('4', 'madd sign found'),
+    'sil_alif':   ('5', 'mark for silent alif found'),
+    'min_y':      ('6', 'miniature ya found'),
+    'min_w':      ('7', 'miniature waw found'),
+    'no_prnc':    ('8', 'mark in alif for not pronouncing found'),
+    'hapax_06ea': ('9', 'hapax sign U+06ea found'),
+    'hapax_06eb': ('A', 'hapax sign U+06eb found'),
+    'hapax_06ec': ('B', 'hapax sign U+06ec found'),
+    'mim':        ('C', 'miniature mim U+06e2 found'),
+    'sin':        ('C', 'miniature sin U+06dc found'),
 }
 
+# the warning line of each check is constant up to the offending token, so the
+# prefix is rendered once here instead of once per warning
+CHECK_WARNINGS = {group: f'WARNING-{num}! untreated tajweed traces! {msg} in'
+                  for group, (num, msg) in CHECK_MESSAGES.items()}
+
+def _json_load(fp):
+    """ parse a json file with orjson when available, falling back to ujson.
+
+    Args:
+        fp (TextIOBase): input json file.
+
+    Return:
+        object: parsed json data.
+
+    """
+    return orjson.loads(fp.read()) if orjson else json.load(fp)
+
+def _json_dump(obj, fp):
+    """ serialise obj to a json file with orjson when available, falling back to ujson.
+
+    Args:
+        obj (object): data to serialise.
+        fp (TextIOBase): output json file.
+
+    """
+    if orjson:
+        fp.write(orjson.dumps(obj).decode())
+    else:
+        json.dump(obj, fp)
+
 def preproc(s):
     """remove quranic punctuation (U+06d6 - U+06db)
 
@@ -496,6 +1237,14 @@ def preproc(s):
     """
     return QSTOPS_REGEX.sub('', s)
 
+# we keep 3 main POS, N(oun), V(erb), P(article); flattened once at import
+POS_MAPPING = {p:POS for POS,pos in (
+    ('N', {'PN', 'ADJ', 'LOC', 'DEM', 'EMPH', 'IMPV', 'PRP'}),
+    ('P', {'IMPN', 'PRON', 'REL', 'T', 'CONJ' 'SUB', 'ACC', 'AMD', 'ANS', 'AVR', 'CAUS', 'CERT',
+           'CIRC', 'COM', 'COND', 'EQ', 'EXH', 'EXL', 'EXP', 'FUT', 'INC', 'INT', 'INTG', 'NEG', 'PREV', 'PRO',
+           'REM', 'RES', 'RET', 'RSLT', 'SUP', 'SUR', 'VOC', 'INL'})
+) for p in pos}
+
 def _qmorf_process():
     """ create json file containing all quran indexes and their token plus corresponding POS(s), LEMA(s) and derivational information.
 
@@ -507,18 +1256,12 @@ def _qmorf_process():
        ...}
 
     """
-    # we keep 3 main POS, N(oun), V(erb), P(article)
-    POS_MAPPING = {p:POS for POS,pos in (
-        ('N', {'PN', 'ADJ', 'LOC', 'DEM', 'EMPH', 'IMPV', 'PRP'}),
-        ('P', {'IMPN', 'PRON', 'REL', 'T', 'CONJ' 'SUB', 'ACC', 'AMD', 'ANS', 'AVR', 'CAUS', 'CERT',
-               'CIRC', 'COM', 'COND', 'EQ', 'EXH', 'EXL', 'EXP', 'FUT', 'INC', 'INT', 'INTG', 'NEG', 'PREV', 'PRO',
-               'REM', 'RES', 'RET', 'RSLT', 'SUP', 'SUR', 'VOC', 'INL'})
-    ) for p in pos}
+    pos_get = POS_MAPPING.get
 
     with open(QDT_FNAME) as infp, \
          open(QMORF_FNAME, 'w') as outfp:
 
-        dt_quran = json.load(infp)
+        dt_quran = _json_load(infp)
 
         qmorf = {}
         for item in dt_quran:
@@ -526,7 +1269,7 @@ def _qmorf_process():
             ind = f'{item["sura"]},{item["vers"]},{item["word"]}'
 
             # unique list of normalised POS (i.e. only N, V or P metaclasses), keeping the order
-            POS_list = tuple(dict.fromkeys([POS_MAPPING.get(morf['POS'], morf['POS']) for morf in item['morf']]))
+            POS_list = tuple(dict.fromkeys(pos_get(morf['POS'], morf['POS']) for morf in item['morf']))
 
             qmorf[ind] = {'tok': preproc(item['tok']),
                           'pos': POS_list,
@@ -534,99 +1277,206 @@ def _qmorf_process():
                           'roots': list(filter(None, (m['root'] for m in item['morf']))),
                           'derv': list(filter(None, (m['derv'] for m in item['morf'])))}
 
-        json.dump(qmorf, outfp)
+        _json_dump(qmorf, outfp)
+
+def _qmorf_index(qmorf):
+    """ repack the qmorf json for the applier.
+
+    The json file is keyed by 's,v,w' strings; the applier looks entries up by
+    the packed int index instead (cf. _pack_indexes), so the keys are converted
+    once at load. pos becomes a frozenset and the root endings that the HU/HI
+    checks scan for are precomputed as flags, so the per-token checks are a
+    set lookup and a boolean load.
 
-def apply_rules(tokens, rules, qmorf, counts=None, debug=False):
+    Args:
+        qmorf (dict): parsed qmorf json (cf. _qmorf_process).
+
+    Return:
+        dict: qmorf keyed by packed index, with pos and root flags prepared.
+
+    """
+    indexed = {}
+    for key, morf in qmorf.items():
+        s, v, w = map(int, key.split(','))
+        morf['pos'] = frozenset(morf['pos'])
+        morf['roots_end_h'] = any(r[-1] == 'ه' for r in morf['roots'])
+        morf['roots_end_hy'] = any(r[-2:] == 'هي' for r in morf['roots'])
+        indexed[s<<20 | v<<10 | w] = morf
+    return indexed
+
+def apply_rules(tokens, rules, qmorf, counts=None, debug=False, fused=None, exact=None, stop=None):
     """ Remove or add the orthographic phonetic layer to the quranic text.
 
     Args:
         tokens_ (list): sequence of quranic token, index pairs.
-        rules (iterator): rules to apply to text.
+        rules (RuleTable): residual compiled rules to apply to text.
         qpos (dict): sequence of quranic type, list of normalised POS pairs.
             Possible POS are N(oun), V(erb) or P(artible).
-        counts (dict): structure containing in which indexes a rule has been applied and how many times
-            and if it is applied at word boundary.
+        counts (defaultdict): structure containing in which indexes a rule has been applied and how many times
+            and if it is applied at word boundary; a defaultdict of lists (or a
+            dict pre-seeded with every id_rule), so recording a firing is one
+            append without a membership test.
                 id_rule: [((s,v,w), count, is_boundary), ...]
         debug (bool): debug mode.
+        fused (str): key of the fused table in FUSED_TABLES, applied once per
+            token before the sequential rules; results are memoized by token.
+        exact (dict): full-token replacements (cf. _extract_exact_rules), checked
+            once per token with a dict lookup.
+        stop (int): number of leading tokens to give a turn; the tokens after
+            them still feed the boundary checks of the last turns (lookahead
+            of the parallel cuts, cf. apply_rules_parallel).
 
     """
     ntokens = len(tokens)
+    nturns = ntokens if stop is None else stop
 
-    for i in range(ntokens):
+    # local bindings of the hot lookups: attribute and global loads inside the
+    # token loop cost a dict access per iteration, locals do not
+    run = rules.run_dbg if debug else rules.run
+    trigger_table = rules.trigger_table
+    tanwin_gate = rules.tanwin_gate
+    qmorf_get = qmorf.get
 
-        wordform_rasm = next(rasm(io.StringIO(tokens[i][0])))[-1]
+    for i in range(nturns):
 
-        for id_rule, ((tok_pre, tok_post), (repl_pre, repl_post)), (pat, repl), \
-            FILTER_POS, except_ind, except_lemas, force_ind, restrict_ind in rules:
+        if exact is not None and (hit := exact.get(tokens[i][0])) is not None:
 
-            ind = tokens[i][1][0], tokens[i][1][1], tokens[i][1][2]
-            ind_key = ','.join(map(str,ind))
+            id_rule, repl_tok = hit
 
-            if restrict_ind and ind not in restrict_ind:
-                continue
+            if debug:
+                print(f'[[DEBUG::INSID]] id_rule={id_rule} {tokens[i][1]} ori={tokens[i][0]} new={repl_tok} cnt=1 filter=None', file=sys.stderr) #TRACE
 
-            if ind in except_ind:
-                continue
+            if counts != None:
+                counts[id_rule].append((tokens[i][1], 1, False))
 
-            if FILTER_POS and FILTER_POS not in qmorf[ind_key]['pos']:
-                continue
+            tokens[i][0] = repl_tok
 
+        if fused is not None:
 
-            if ind not in force_ind and id_rule in ('HU', 'HI'):
+            cur_tok_modif, fired = _apply_fused(tokens[i][0], fused)
 
-                # madd rule for enclitic -h should not be applied to final -h belonging to lemma
-                if qmorf[ind_key]['roots'] and any(r[-1]=='ه' for r in qmorf[ind_key]['roots']) and wordform_rasm[-2:] != 'هه':
-                    if ind == (2,237,21): print('diff 1', qmorf[ind_key], wordform_rasm) #FIXME
-                    continue
-            
-                # e.g. 19:46:9  تَنتَهِ pos=V  lemas=ٱنتَهَىٰ  root=نهي  derv=['IMPF', '(VIII)'] 
-                if any(r[-2:]=='هي' for r in qmorf[ind_key]['roots']) and wordform_rasm[-2:] != 'هه':
-                    if ind == (2,237,21): print('diff 2', qmorf[ind_key], wordform_rasm) #FIXME
-                    continue
+            if fired:
+                for id_rule, cnt in fired:
 
-            # rule between word boundary
-            if tok_pre and i<ntokens-1 and re.search(f'{tok_pre}$', tokens[i][0]) and re.search(f'^{tok_post}', tokens[i+1][0]):
+                    if debug:
+                        print(f'[[DEBUG::INSID]] id_rule={id_rule} {tokens[i][1]} ori={tokens[i][0]} new={cur_tok_modif} cnt={cnt} filter=None', file=sys.stderr) #TRACE
 
-                cur_tok_modif, cnt = re.subn(f'{tok_pre}$', repl_pre, tokens[i][0])
+                    if counts != None:
+                        counts[id_rule].append((tokens[i][1], cnt, False))
 
-                if counts != None and cnt:
-                    if id_rule in counts:
-                        counts[id_rule].append((tokens[i][1], cnt, True))
-                    else:
-                        counts[id_rule] = [(tokens[i][1], cnt, True)]
+                tokens[i][0] = cur_tok_modif
 
-                # the next word may have a change or not, depending on the rule
-                if not repl_post:
+        features = 0
+        tok_mask = 0
+        for ch in tokens[i][0]:
+            features |= trigger_table.get(ch, 0)
+            tok_mask |= 1 << (ord(ch) & 63)
 
-                    if cnt and debug:
-                        print(f'[[DEBUG::BND.1]] id_rule={id_rule} {tokens[i][1]} ori={tokens[i][0]} (next={tokens[i+1][0]}) '
-                              f'new={cur_tok_modif} cnt={cnt} filter={FILTER_POS}', file=sys.stderr) #TRACE
+        ind = tokens[i][1]
+        ind_pk = ind[0]<<20 | ind[1]<<10 | ind[2]
+        morf = qmorf_get(ind_pk)
 
-                else:
-                    next_tok_modif = re.sub(f'^{tok_post}', repl_post, tokens[i+1][0])
-                    
-                    if cnt and debug:
-                        print(f'[[DEBUG::BND.2]] id_rule={id_rule} {tokens[i][1]} ori={tokens[i][0]} (next={tokens[i+1][0]}) '
-                              f'new={cur_tok_modif} (next={next_tok_modif}) cnt={cnt} filter={FILTER_POS}', file=sys.stderr) #TRACE
+        tanwin_tail = tanwin_gate is not None and tanwin_gate.search(tokens[i][0]) is not None
 
-                    tokens[i+1][0] = next_tok_modif
+        run(tokens, i, ntokens, ind_pk, morf, features, tok_mask, tanwin_tail, counts, debug)
 
-                tokens[i][0] = cur_tok_modif
+def _init_workers(table_key, qmorf, with_counts=False):
+    """ store the shared rule data in worker globals so each chunk task only
+    has to pickle its own tokens.
 
-            # rule inside a word
-            if pat:
+    Args:
+        table_key (str): key of the rule tables to apply, 'rm' or 'add'.
+        qmorf (dict): sequence of quranic index, morphological info pairs.
+        with_counts (bool): collect counts of rule firings in the workers.
 
-                cur_tok_modif, cnt = re.subn(pat, repl, tokens[i][0])
+    """
+    global _W_TABLE, _W_EXACT, _W_QMORF, _W_FUSED, _W_COUNTS
+    _W_TABLE = REMOVE_TABLE if table_key == 'rm' else RESTORE_TABLE
+    _W_EXACT = REMOVE_EXACT if table_key == 'rm' else RESTORE_EXACT
+    _W_QMORF = qmorf
+    _W_FUSED = table_key
+    _W_COUNTS = with_counts
 
-                if cnt and debug:
-                    print(f'[[DEBUG::INSID]] id_rule={id_rule} {tokens[i][1]} ori={tokens[i][0]} new={cur_tok_modif} cnt={cnt} filter={FILTER_POS}', file=sys.stderr) #TRACE
-                tokens[i][0] = cur_tok_modif
+def _apply_chunk(task):
+    """ apply the rules to one chunk of tokens and return the modified
+    wordforms, with the counts of the chunk when they are collected.
 
-                if counts != None and cnt:
-                    if id_rule in counts:
-                        counts[id_rule].append((tokens[i][1], cnt, False))
-                    else:
-                        counts[id_rule] = [(tokens[i][1], cnt, False)]
+    Args:
+        task (tuple): sequence of quranic token, index pairs — the chunk plus
+            the lookahead token of the next chunk, when there is one — and the
+            number of leading tokens that belong to the chunk itself.
+
+    Return:
+        list, dict: modified wordforms, in order and lookahead included, and
+            counts of rule firings within the chunk, or None.
+
+    """
+    chunk, stop = task
+    counts = defaultdict(list) if _W_COUNTS else None
+    apply_rules(chunk, _W_TABLE, _W_QMORF, counts=counts, debug=False, fused=_W_FUSED, exact=_W_EXACT, stop=stop)
+    return [tok for tok, _ in chunk], counts
+
+def apply_rules_parallel(tokens, table_key, qmorf, jobs, counts=None):
+    """ apply the rules to tokens with jobs worker processes, modifying tokens in place.
+
+    The work is split at sura boundaries, but the cuts are not rule-inert: a
+    boundary rule can fire across them (MADD-hmz rewrites the final word of
+    sura 98 before the hamza opening sura 99), so every chunk carries the
+    first token of the next one as a lookahead that the last turn can read
+    and rewrite, and only the chunk's own tokens get a turn. When a chunk
+    comes back with its lookahead rewritten, the next chunk started from a
+    stale first token and is redone here from the reconciled one; that takes
+    a rule whose replacement reaches the token after the cut, which no rule
+    of the mushaf does, so in practice every chunk comes straight from the
+    workers. Each worker collects the counts of its own chunk and they are
+    merged in chunk order, so the traces of a rule end up in the same corpus
+    order as in a sequential run.
+
+    Args:
+        tokens (list): sequence of quranic token, index pairs.
+        table_key (str): key of the rule tables to apply, 'rm' or 'add'.
+        qmorf (dict): sequence of quranic index, morphological info pairs.
+        jobs (int): number of worker processes.
+        counts (dict): structure to merge the counts of the workers into, as
+            in apply_rules, or None.
+
+    """
+    table = REMOVE_TABLE if table_key == 'rm' else RESTORE_TABLE
+    exact = REMOVE_EXACT if table_key == 'rm' else RESTORE_EXACT
+    bounds = [0] + [i for i in range(1, len(tokens)) if tokens[i][1][0] != tokens[i-1][1][0]] + [len(tokens)]
+    chunks = [tokens[start:end] for start, end in zip(bounds, bounds[1:])]
+    tasks = [(chunk + chunks[c+1][:1], len(chunk)) if c+1 < len(chunks) else (chunk, len(chunk))
+             for c, chunk in enumerate(chunks)]
+
+    with Pool(jobs, initializer=_init_workers, initargs=(table_key, qmorf, counts is not None)) as pool:
+        results = pool.map(_apply_chunk, tasks)
+
+    i = 0
+    carried = None
+    for c, (chunk_toks, chunk_counts) in enumerate(results):
+        size = len(chunks[c])
+        if carried is not None:
+            # the previous cut rewrote this chunk's first token, so the worker
+            # result is stale: redo the chunk in order from the reconciled
+            # token, with its own lookahead so the next cut is carried on
+            redo = [[tok, ind] for tok, ind in tasks[c][0]]
+            redo[0][0] = carried
+            chunk_counts = defaultdict(list) if counts is not None else None
+            apply_rules(redo, table, qmorf, counts=chunk_counts, debug=False, fused=table_key, exact=exact, stop=size)
+            chunk_toks = [tok for tok, _ in redo]
+        carried = None
+        if len(chunk_toks) > size and chunk_toks[size] != chunks[c+1][0][0]:
+            carried = chunk_toks[size]
+        # unpickling gives every repeated wordform its own string again, so
+        # the results are interned on the way back like the loaded corpus;
+        # the restore phase of --eval then feeds shared objects to the
+        # memoized fused pass and the exact lookups
+        for tok in chunk_toks[:size]:
+            tokens[i][0] = sys.intern(tok)
+            i += 1
+        if counts is not None:
+            for id_rule, traces in chunk_counts.items():
+                counts[id_rule].extend(traces)
 
 
 if __name__ == '__main__':
@@ -643,6 +1493,7 @@ if __name__ == '__main__':
                                       help='restrict to specific Quranic sura `s` or verse `s:v`')
     parser.add_argument('--json', action='store_true', help='print output in json (for --rm/--add)')
     parser.add_argument('--save_counts', metavar='FILE', dest='countsfp', type=FileType('w'), help='save counts of rules in json file (for --eval)')
+    parser.add_argument('--jobs', metavar='N', type=int, default=1, help='number of worker processes')
     parser.add_argument('--debug', action='store_true', help='show debugging info')
 
     args = parser.parse_args()
@@ -654,7 +1505,7 @@ if __name__ == '__main__':
     if args.force_qmorf or not os.path.exists(QMORF_FNAME):
         _qmorf_process()
     with open(QMORF_FNAME) as fp:
-        QMORF = json.load(fp)
+        QMORF = _qmorf_index(_json_load(fp))
 
     #
     # prepare quranic data
@@ -667,31 +1518,48 @@ if __name__ == '__main__':
         qindex = ((0, None, None, None), (114, None, None, None))
 
     if args.infile:
-        qtokens = json.load(args.infile)
+        qtokens = _json_load(args.infile)
+        # intern the wordforms so the repeated tokens of the corpus share one
+        # object and the memoized fused pass and the exact lookups compare by
+        # pointer instead of character by character
+        for q in qtokens:
+            q[0] = sys.intern(q[0])
     else:
-        qtokens = [[preproc(tok), ind] for tok, *_, ind in rasm(qindex, source='decotype', only_rasm=True)] #FIXME
+        qtokens = [[sys.intern(preproc(tok)), ind] for tok, *_, ind in rasm(qindex, source='decotype', only_rasm=True)] #FIXME
 
     #
     # apply remove rules
     # 
 
     if args.rm:
-        apply_rules(qtokens, REMOVE_SANDHI_RULES, QMORF, counts=None, debug=args.debug)
+        if args.jobs > 1 and not args.debug:
+            apply_rules_parallel(qtokens, 'rm', QMORF, args.jobs)
+        else:
+            apply_rules(qtokens, REMOVE_TABLE, QMORF, counts=None, debug=args.debug, fused='rm', exact=REMOVE_EXACT)
         if args.json:
-            json.dump(qtokens, args.outfile)
+            _json_dump(qtokens, args.outfile)
         else:
-            print(' '.join(t for t,i in qtokens), file=args.outfile)
+            # write the tokens as they come instead of joining the whole quran
+            # into one giant string first
+            for j, (t, _) in enumerate(qtokens):
+                args.outfile.write(' ' + t if j else t)
+            args.outfile.write('\n')
 
     #
     # aply restore rules
     #
 
     elif args.add:
-        apply_rules(qtokens, RESTORE_SANDHI_RULES, QMORF, counts=None, debug=args.debug)
+        if args.jobs > 1 and not args.debug:
+            apply_rules_parallel(qtokens, 'add', QMORF, args.jobs)
+        else:
+            apply_rules(qtokens, RESTORE_TABLE, QMORF, counts=None, debug=args.debug, fused='add', exact=RESTORE_EXACT)
         if args.json:
-            json.dump(qtokens, args.outfile)
+            _json_dump(qtokens, args.outfile)
         else:
-            print(' '.join(t for t,i in qtokens), file=args.outfile)
+            for j, (t, _) in enumerate(qtokens):
+                args.outfile.write(' ' + t if j else t)
+            args.outfile.write('\n')
 
     #
     # perform evaluation: apply both remove and restore rules
@@ -700,21 +1568,30 @@ if __name__ == '__main__':
     else:
         print('>> applying remove rules...')
         counts_rm = {i[0]:[] for i in REMOVE_SANDHI_RULES}
-        qtokens_detajweed = deepcopy(qtokens)
-        apply_rules(qtokens_detajweed, REMOVE_SANDHI_RULES, QMORF, counts_rm, debug=args.debug)
+        # the rules only ever rebind the wordform slot, so the fresh 2-lists
+        # can share the untouched quranic indexes; deepcopy walks every index
+        # through the generic dispatch machinery for nothing
+        qtokens_detajweed = [[t, i] for t, i in qtokens]
+        if args.jobs > 1 and not args.debug:
+            apply_rules_parallel(qtokens_detajweed, 'rm', QMORF, args.jobs, counts=counts_rm)
+        else:
+            apply_rules(qtokens_detajweed, REMOVE_TABLE, QMORF, counts_rm, debug=args.debug, fused='rm', exact=REMOVE_EXACT)
         if args.debug:
             print('qtokens_detajweed =', ' '.join(t for t,_ in qtokens_detajweed))
         
         print('>> applying restore rules...')
         counts_add = {i[0]:[] for i in RESTORE_SANDHI_RULES}
-        qtokens_restored = deepcopy(qtokens_detajweed)
-        apply_rules(qtokens_restored, RESTORE_SANDHI_RULES, QMORF, counts_add, debug=args.debug)
+        qtokens_restored = [[t, i] for t, i in qtokens_detajweed]
+        if args.jobs > 1 and not args.debug:
+            apply_rules_parallel(qtokens_restored, 'add', QMORF, args.jobs, counts=counts_add)
+        else:
+            apply_rules(qtokens_restored, RESTORE_TABLE, QMORF, counts_add, debug=args.debug, fused='add', exact=RESTORE_EXACT)
         if args.debug:
             print('qtokens_restored =', ' '.join(t for t,_ in qtokens_restored))
 
         if args.countsfp:
             cnt_obj = {rule: [{'ind':i, 'cnt':c, 'bound':b} for i,c,b in ind_list] for rule, ind_list in counts_rm.items()}
-            json.dump(cnt_obj, args.countsfp)
+            _json_dump(cnt_obj, args.countsfp)
 
         for id_, traces_rm in counts_rm.items():
             traces_add = counts_add.get(id_, [])
@@ -737,7 +1614,9 @@ if __name__ == '__main__':
         # check original text and restored text are equal
         #
 
-        if ' '.join(t for t,_ in qtokens) == ' '.join(t for t,_ in qtokens_restored):
+        # compare the wordform lists directly instead of materialising the two
+        # corpus strings just to test them for equality
+        if [t for t,_ in qtokens] == [t for t,_ in qtokens_restored]:
             print('\n>> Original and restored qtexts match!')
         else:
             print('\n>> FAIL!! original and restored qtexts are different')
@@ -752,54 +1631,20 @@ if __name__ == '__main__':
         # check that there are no traces of the tajweed layer in the detajweed conversion
         #
 
-        SUKUN_REGEX = re.compile(f'[{CONS}](?<!ُو|ِی)[{CONS}]')
-        SHADDA_REGEX = re.compile(f'^[{CONS}]ّ')
-        TANWIN_REGEX = re.compile(f'[ࣰࣱࣲ]|َۢ|ُۢ|ِۭ')
-
         cnt = 0
 
         #TODO compare rasm of detajweedised and tajweedised
 
         # if a word has several traces, show only one of them
         for tok, ind in qtokens_detajweed:
-            if SUKUN_REGEX.search(tok) and ind not in EXCEPTIONS_SUKUN:
-                print(f'WARNING-1! untreated tajweed traces! consonant without harakat nor sukun in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif SHADDA_REGEX.search(tok):
-                print(f'WARNING-2! untreated tajweed traces! shadda on initial consonant of word in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif TANWIN_REGEX.search(tok):
-                print(f'WARNING-3! untreated tajweed traces! tanwin with tajweed in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif 'ٓ' in tok or 'آ' in tok:
-                print(f'WARNING-4! untreated tajweed traces! madd sign found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif '۠' in tok:
-                print(f'WARNING-5! untreated tajweed traces! mark for silent alif found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif 'ۦ' in tok or 'ۧ' in tok:
-                print(f'WARNING-6! untreated tajweed traces! miniature ya found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif 'ۥ' in tok:
-                print(f'WARNING-7! untreated tajweed traces! miniature waw found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif '۟' in tok:
-                print(f'WARNING-8! untreated tajweed traces! mark in alif for not pronouncing found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif '۪' in tok:
-                print(f'WARNING-9! untreated tajweed traces! hapax sign U+06ea found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif '۫' in tok:
-                print(f'WARNING-A! untreated tajweed traces! hapax sign U+06eb found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif '۬' in tok:
-                print(f'WARNING-B! untreated tajweed traces! hapax sign U+06ec found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif 'ۢ' in tok:
-                print(f'WARNING-C! untreated tajweed traces! miniature mim U+06e2 found in {tok} Q.{":".join(map(str, ind))}')
-                cnt += 1
-            elif 'ۜ' in tok:
-                print(f'WARNING-C! untreated tajweed traces! miniature sin U+06dc found in {tok} Q.{":".join(map(str, ind))}')
+            if len(tok.translate(CHECK_SPECIAL_TABLE)) == len(tok):
+                m = CHECK_SUKUN_SHADDA_REGEX.search(tok)
+            else:
+                m = CHECK_REGEX.search(tok)
+            if m is not None and m.lastgroup == 'sukun' and ind in EXCEPTIONS_SUKUN:
+                m = CHECK_NOSUKUN_REGEX.search(tok)
+            if m is not None:
+                print(CHECK_WARNINGS[m.lastgroup], tok, f'Q.{":".join(map(str, ind))}')
                 cnt += 1
 
         print(f'Total {cnt} warnings')
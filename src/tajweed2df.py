@@ -24,13 +24,51 @@
 import os
 import io
 import re
+import csv
 import sys
-import pandas as pd
+import pickle
+import numpy as np
 import ujson as json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ijson
+except ImportError:
+    ijson = None
 from argparse import ArgumentParser, FileType
 
 from rasm import rasm
 
+# the quranic indexes never change between runs, so the rasm iteration is
+# cached on disk after the first run (cf. --no_cache)
+CACHE_FNAME = os.path.expanduser('~/.cache/tajweed/rasm_indexes_df.pkl')
+
+
+def _quran_indexes(use_cache=True):
+    """ get the sequence of quranic indexes, caching the rasm iteration on disk.
+
+    Args:
+        use_cache (bool): read and refresh the pickle cache.
+
+    Return:
+        list: quranic indexes, in corpus order.
+
+    """
+    if use_cache and os.path.exists(CACHE_FNAME):
+        with open(CACHE_FNAME, 'rb') as fp:
+            return pickle.load(fp)
+
+    indexes = [qind for *_, qind in rasm(((1,1,1,1), (114,6,3,4)), paleo=True)]
+
+    if use_cache:
+        os.makedirs(os.path.dirname(CACHE_FNAME), exist_ok=True)
+        with open(CACHE_FNAME, 'wb') as fp:
+            pickle.dump(indexes, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return indexes
+
 
 RULE_GROUPS = {
     'ASSIM-M': ['M1', 'M2'],
@@ -53,7 +91,7 @@ RULE_GROUPS = {
 #FIXME add reference
 # According to Nicolai Sinai the following list seems to be additions:
 # Q. 52:21, 53:23, 53:26–32, 69:7, 73:20, 74:31, 74:56, 78:37–40, 81:29, 84:25, 85:7–11, 87:7, 89:15–16, 89:23–24, 89:27–30, 90:17–20, 95:6, 97:4, and 103:3
-EXCLUDE = [(52,21), (53,23), (53,26), (53,27), (53,28), (53,29), (53,30), (53,31), (53,32),
+EXCLUDE = frozenset({(52,21), (53,23), (53,26), (53,27), (53,28), (53,29), (53,30), (53,31), (53,32),
            (69,7),
            (73,20), (74,31), (74,56),
            (78,37), (78,38), (78,39), (78,40),
@@ -63,7 +101,7 @@ EXCLUDE = [(52,21), (53,23), (53,26), (53,27), (53,28), (53,29), (53,30), (53,31
            (89,15), (89,16), (89,23), (89,24), (89,27), (89,28), (89,29), (89,30), (90,17), (90,18), (90,19), (90,20),
            (95,6),
            (97,4),
-           (103,3)]
+           (103,3)})
 
 
 if __name__ == '__main__':
@@ -76,23 +114,29 @@ if __name__ == '__main__':
     parser.add_argument('--exclude', action='store_true', help='exclude verses that have been identified as possible later additions')
     parser.add_argument('--restrict', action='store_true', help='include ONLY verses have been identified as possible later additions')
     parser.add_argument('--chunks', metavar='SIZE', type=int, help='aggregate counts in chunks of words instead of by verses')
+    parser.add_argument('--no_cache', action='store_true', help='do not use the on-disk cache of the quran indexes')
     parser.add_argument('--debug', action='store_true', help='show debugging info')
     args = parser.parse_args()
 
-    counts = json.load(args.infile)
+    # when ijson is available the counts stream in rule by rule, so the whole
+    # json is never resident; otherwise it is parsed in one go
+    if ijson is not None:
+        count_items = ijson.kvitems(args.infile, '')
+    else:
+        count_items = (orjson.loads(args.infile.read()) if orjson else json.load(args.infile)).items()
 
     RULE_MAPPER = {rule:gr for gr,rule_li in RULE_GROUPS.items() for rule in rule_li}
 
-    if args.groups:
-        _cnt = dict(zip(RULE_GROUPS, [0]*len(RULE_GROUPS)))
-    else:
-        _cnt = dict(zip(RULE_MAPPER, [0]*len(RULE_MAPPER)))
+    _cnt = dict.fromkeys(RULE_GROUPS if args.groups else RULE_MAPPER, 0)
 
-    cnt_inner = dict(_cnt)
-    cnt_bound = dict(_cnt)
+    # one column slot per rule (or group), inner counts in the first ncols
+    # columns of each row and boundary counts in the next ncols
+    rule_to_col = {name: i for i, name in enumerate(_cnt)}
+    ncols = len(rule_to_col)
 
-    rows = []
-    for qara, _, _, qpal, qind in rasm(((1,1,1,1), (114,6,3,4)), paleo=True):
+    qindexes = []
+    row_of = {}
+    for qind in _quran_indexes(not args.no_cache):
 
         if args.restrict and (qind[0], qind[1]) not in EXCLUDE:
             continue
@@ -100,53 +144,69 @@ if __name__ == '__main__':
         if args.exclude and (qind[0], qind[1]) in EXCLUDE:
             continue
 
-        for rule, tokens in counts.items():
+        # rows are keyed by the packed index, as in tajweed.py, so the lookup
+        # per token below hashes one int instead of building a tuple
+        row_of[qind[0]<<20 | qind[1]<<10 | qind[2]] = len(qindexes)
+        qindexes.append(':'.join(map(str, qind)))
+
+    # single pass over the counts: each token goes straight to its fused row
+    # and column index, without an intermediate per-index grouping that would
+    # only be walked again; tokens whose index falls outside the iterated
+    # range are skipped as before
+    HAPAX = set(RULE_GROUPS['HAPAX'])
+
+    fused = []
+    weights = []
+    # local bindings of the per-token lookups, as in the applier of tajweed.py
+    row_get = row_of.get
+    fused_append = fused.append
+    weights_append = weights.append
+    for rule, tokens in count_items:
+
+        # each rule appears once in the stream, so resolving its output
+        # column here is the same one-shot work as a precomputed table, with
+        # the --groups remapping and the --rm_hapax filter folded in
+        if args.rm_hapax and rule in HAPAX:
+            continue
+        col = rule_to_col[RULE_MAPPER[rule] if args.groups else rule]
 
-            if args.rm_hapax and rule in RULE_GROUPS['HAPAX']:
+        for token in tokens:
+            s, v, w = token['ind']
+            row = row_get(s<<20 | v<<10 | w)
+            if row is None:
                 continue
-            
-            if args.groups:
-                rule = RULE_MAPPER[rule]
-
-            for token in tokens:
-                if tuple(token['ind']) == qind:
-
-                    if token['bound']:
-                        cnt_bound[rule] += token['cnt']
-                    else:
-                        cnt_inner[rule] += token['cnt']
+            fused_append(row*2*ncols + col + (ncols if token['bound'] else 0))
+            weights_append(token['cnt'])
 
-        rows.append({**{'qindex': ':'.join(map(str, qind))},
-                     **{k+'_I':v for k,v in cnt_inner.items()},
-                     **{k+'_B':v for k,v in cnt_bound.items()}})
-
-        cnt_inner = dict(_cnt)
-        cnt_bound = dict(_cnt)
+    out = np.bincount(fused, weights=weights,
+                      minlength=len(qindexes)*2*ncols).astype(np.int32).reshape(len(qindexes), 2*ncols)
+    all_cols = [k+'_I' for k in _cnt] + [k+'_B' for k in _cnt]
 
     if args.chunks:
-        aux = []
-        for i in range(0, len(rows), args.chunks):
-            row_group = rows[i:i+args.chunks]
-            qindex = row_group[0]['qindex']
-            for r in row_group:
-                r.pop('qindex')
-            new_row = dict(zip(row_group[0].keys(), [0]*len(row_group[0])))
-            for row in row_group:
-                for k in row:
-                    new_row[k] += row[k]
-            new_row['qindex'] = qindex
-            aux.append(new_row)
-        rows = aux
-
-    df = pd.DataFrame([r.values() for r in rows])
-    df.columns = rows[0].keys()
+        # one segmented reduction sums every chunk of rows, ragged tail
+        # included, without padding the table to a whole number of chunks
+        out = np.add.reduceat(out, np.arange(0, len(out), args.chunks), axis=0)
+        qindexes = qindexes[::args.chunks]
+        # qindex goes last, as in the chunked rows of the dict layout
+        table = [(name, out[:, i]) for i, name in enumerate(all_cols)] + [('qindex', qindexes)]
+    else:
+        table = [('qindex', qindexes)] + [(name, out[:, i]) for i, name in enumerate(all_cols)]
 
     # move qindex from last column position to first position
-    cols = df.columns.tolist()
-    df = df[cols[-1:]+cols[:-1]]
-
-    # remove columns that only contain zeros
-    df = df.loc[:, (df!=0).any(axis=0)]
-
-    df.to_csv(args.outfile, index=False)
+    table = table[-1:] + table[:-1]
+
+    # remove columns that only contain zeros, testing the int table instead of
+    # a boolean pass over the whole output
+    keep = {name for name, any_ in zip(all_cols, (out != 0).any(axis=0)) if any_}
+    keep.add('qindex')
+    table = [(name, vals) for name, vals in table if name in keep]
+
+    # the values are plain ints and the qindex strings, so the csv streams
+    # straight out of the columns instead of through a DataFrame built only to
+    # serialise it
+    with open(args.outfile, 'w', newline='') as outfp:
+        writer = csv.writer(outfp, lineterminator='\n')
+        writer.writerow([name for name, _ in table])
+        writer.writerows(zip(*(vals.tolist() if isinstance(vals, np.ndarray) else vals
+                               for _, vals in table)))
 
@@ -27,8 +27,14 @@
 #
 ####################################################################################################################
 
+import os
 import sys
+import pickle
 import ujson as json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from argparse import ArgumentParser, FileType
 
 from rasm import rasm
@@ -36,6 +42,34 @@ from rasm import rasm
 # group rules in main categories
 RULES = ['M', 'N', 'SHMS', 'MTHL', 'MTJNS']
 
+# the quranic indexes never change between runs, so the rasm iteration is
+# cached on disk after the first run (cf. --no_cache)
+CACHE_FNAME = os.path.expanduser('~/.cache/tajweed/rasm_indexes_tabular.pkl')
+
+
+def _quran_indexes(use_cache=True):
+    """ get the sequence of quranic indexes, caching the rasm iteration on disk.
+
+    Args:
+        use_cache (bool): read and refresh the pickle cache.
+
+    Return:
+        list: quranic indexes, in corpus order.
+
+    """
+    if use_cache and os.path.exists(CACHE_FNAME):
+        with open(CACHE_FNAME, 'rb') as fp:
+            return pickle.load(fp)
+
+    indexes = [i for *_, i in rasm(((0, None, None, None), (114, None, None, None)))]
+
+    if use_cache:
+        os.makedirs(os.path.dirname(CACHE_FNAME), exist_ok=True)
+        with open(CACHE_FNAME, 'wb') as fp:
+            pickle.dump(indexes, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return indexes
+
 #TODO
 # - add arg for range
 # - add exclusion list. Aaccording to Nicolai Sinai the following list seem to be additions:
@@ -50,25 +84,31 @@ if __name__ == '__main__':
     parser.add_argument('infile', nargs='?', type=FileType('r'), default=sys.stdin, help='input json file')
     parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='output csv file')
     parser.add_argument('-n', type=int, help='aggregate counts in n-gram of tokens instead of by verses')
+    parser.add_argument('--no_cache', action='store_true', help='do not use the on-disk cache of the quran indexes')
     args = parser.parse_args()
 
     #
     # prepare data
     #
 
-    rules_counts = json.load(args.infile)
+    rules_counts = orjson.loads(args.infile.read()) if orjson else json.load(args.infile)
     
+    # resolve each rule name to its group once, so the expansion below is a
+    # plain lookup instead of a startswith chain per rule
+    rule_group_of = {rule: next((p for p in RULES if rule.startswith(p)), None) for rule in rules_counts}
+
     parsed = []
-    for rule in rules_counts:
-        rule_gr = None
-        for rule_pat in RULES:
-            if rule.startswith(rule_pat):
-                rule_gr = rule_pat
-                break
-        for word in rules_counts[rule]:
+    for rule, words in rules_counts.items():
+        rule_gr = rule_group_of[rule]
+        if rule_gr is None:
+            # surface unknown rule prefixes here instead of letting them
+            # accumulate under a None column in the output
+            print(f'Warning! rule {rule} does not belong to any group; ignored', file=sys.stderr)
+            continue
+        for word in words:
             ind = tuple(word['ind'])
             cnt = word['cnt']
-    
+
             parsed.append((rule_gr, ind, cnt))
 
     #
@@ -78,20 +118,23 @@ if __name__ == '__main__':
     if args.n:
 
         # prepare quran indexes
-        indexes = [i for *_, i in rasm(((0, None, None, None), (114, None, None, None)))]
+        indexes = _quran_indexes(not args.no_cache)
 
         chunks = [indexes[i:i + args.n] for i in range(0, len(indexes), args.n)]
 
-        merged_ = {i:({'M':0, 'N':0, 'SHMS':0, 'MTHL':0, 'MTJNS':0}, chunks[i-1]) for i in range(1, len(chunks)+1)}
+        # map each quranic index to its chunk once; assigning a token is then
+        # one dict lookup instead of a scan over the index list of every chunk
+        ind_to_chunk = {}
+        for i, chunk in enumerate(chunks, 1):
+            for ind in chunk:
+                ind_to_chunk.setdefault(ind, i)
 
-        for rule_id, rule_ind, rule_cnt in parsed:
-            for i in merged_:
-                count_dic, ind_list = merged_[i]
-                if rule_ind in ind_list:
-                    merged_[i][0][rule_id] = merged_[i][0].get(rule_id, 0)+rule_cnt
-                    break
+        merged = {i:{'M':0, 'N':0, 'SHMS':0, 'MTHL':0, 'MTJNS':0} for i in range(1, len(chunks)+1)}
 
-        merged = {k:v[0] for k,v in merged_.items()}
+        for rule_id, rule_ind, rule_cnt in parsed:
+            i = ind_to_chunk.get(rule_ind)
+            if i is not None:
+                merged[i][rule_id] += rule_cnt
 
     #
     # process data in groups in verses
@@ -100,15 +143,20 @@ if __name__ == '__main__':
     else:
 
         # prepare quran indexes
-        ind_complete = [(i[0], i[1]) for *_, i in rasm(((0, None, None, None), (114, None, None, None)))]
+        ind_complete = [(i[0], i[1]) for i in _quran_indexes(not args.no_cache)]
 
-        seen = set()
-        indexes = [i for i in ind_complete if not (i in seen or seen.add(i))]
+        # order-preserving dedup in C instead of a python loop with a seen set
+        indexes = list(dict.fromkeys(ind_complete))
     
-        merged = {':'.join(map(str, i)):{'M':0, 'N':0, 'SHMS':0, 'MTHL':0, 'MTJNS':0} for i in indexes}
+        # accumulate on the sura, verse tuples directly and render the s:v
+        # labels once per verse at the end, instead of joining a fresh string
+        # for every single token
+        merged = {i:{'M':0, 'N':0, 'SHMS':0, 'MTHL':0, 'MTJNS':0} for i in indexes}
         for rule_id, rule_ind, rule_cnt in parsed:
-            rule_ind = ':'.join(map(str, rule_ind[:-1]))
-            merged[rule_ind][rule_id] = merged[rule_ind].get(rule_id, 0)+rule_cnt
+            rule_ind = rule_ind[:-1]
+            merged[rule_ind][rule_id] += rule_cnt
+
+        merged = {f'{s}:{v}':cnt for (s, v), cnt in merged.items()}
 
     #
     # print csv output